@@ -58,6 +58,11 @@ nonDeterministic = True
 # Probability that Pacman carries out the intended action:
 directionProb = 0.8
 
+# Walls, corners and the size of the board never change during a
+# game, so they are worked out once per layout and kept here until a
+# different layout is loaded. See layoutViews().
+_layoutViews = None
+
 # 
 # Sensing
 #
@@ -132,8 +137,8 @@ def capsules(state):
     # 2) Pacman is not moving, and the capsule is within the visibilityLimit.
     #
     # In both cases, walls block the view.
-    
-    return state.getCapsules()
+
+    return visible(state.getCapsules(), state)
 
 def food(state):
     # Returns a list of (x, y) pairs of food positions
@@ -151,15 +156,16 @@ def food(state):
     #
     # In both cases, walls block the view.
     
-    foodList= []
-    foodGrid = state.getFood()
-    width = foodGrid.width
-    height = foodGrid.height
-    for i in range(width):
-        for j in range(height):
-            if foodGrid[i][j] == True:
-                foodList.append((i, j))
-            
+    # If visibility is partial, only the cells Pacman can see need
+    # to be checked for food.
+    if partialVisibility:
+        foodGrid = state.getFood()
+        return [(x, y) for (x, y) in visibleCells(state) if foodGrid[x][y]]
+
+    # The state keeps the food list up to date as food is eaten, so
+    # there is no need to scan the grid.
+    foodList = state.getFoodList()
+
     # Return list of food that is visible
     return foodList
 
@@ -169,31 +175,24 @@ def walls(state):
     # This version just returns all the current wall locations
     # extracted from the state data.  In later versions, this will be
     # restricted by distance, and include some uncertainty.
-    
-    wallList= []
-    wallGrid = state.getWalls()
-    width = wallGrid.width
-    height = wallGrid.height
-    for i in range(width):
-        for j in range(height):
-            if wallGrid[i][j] == True:
-                wallList.append((i, j))            
-    return wallList
+
+    return list(layoutViews(state)['wallList'])
+
+def mazeDistance(start, end, state):
+    # Returns the number of moves on the shortest path from start to
+    # end, going round the walls, or None if there is no path.
+    #
+    # The distances between every pair of cells in the layout are
+    # worked out once, so this is just a lookup.
+
+    return state.data.layout.getMazeDistance(start, end)
 
 def corners(state):
     # Returns the coordinates of the four corners of the state space.
     #
     # For harder exploration we could obfusticate this information.
 
-    corners=[]
-    wallGrid = state.getWalls()
-    width = wallGrid.width
-    height = wallGrid.height
-    corners.append((0, 0))
-    corners.append((width-1, 0))
-    corners.append((0, height-1))
-    corners.append((width-1, height-1))
-    return corners
+    return list(layoutViews(state)['corners'])
                 
 #
 # Acting
@@ -244,6 +243,35 @@ def makeMove(direction, legal):
 # Details that you don't need to look at if you don't want to.
 #
 
+def layoutViews(state):
+    # Returns a dictionary of the static information about the layout
+    # that the sensing functions need: the wall positions as a list
+    # and as a frozenset, the corners, the width and height, and the
+    # visibility index of the layout (see
+    # Layout.initializeVisibilityMatrix). The visibility index is only
+    # needed with partialVisibility, so visibleCells() fills it in the
+    # first time it is used.
+    #
+    # These are only worked out again when the walls differ from the
+    # ones they were worked out for, which means a different layout.
+
+    global _layoutViews
+    wallGrid = state.getWalls()
+    if _layoutViews is not None:
+        if _layoutViews['wallGrid'] is wallGrid or _layoutViews['wallGrid'] == wallGrid:
+            return _layoutViews
+    width = wallGrid.width
+    height = wallGrid.height
+    wallList = wallGrid.asList()
+    _layoutViews = {'wallGrid': wallGrid,
+                    'visibility': None,
+                    'wallList': wallList,
+                    'wallSet': frozenset(wallList),
+                    'corners': ((0, 0), (width-1, 0), (0, height-1), (width-1, height-1)),
+                    'width': width,
+                    'height': height}
+    return _layoutViews
+
 def distanceLimited(objects, state, limit):
     # When passed a list of object locations, tests how far they are
     # from Pacman, and only returns the ones that are within "limit".
@@ -265,14 +293,14 @@ def inFront(object, facing, state):
     pacman = state.getPacmanPosition()
     pacman_x = pacman[0]
     pacman_y = pacman[1]
-    wallList = walls(state)
+    wallSet = layoutViews(state)['wallSet']
 
     # If Pacman is facing North
     if facing == Directions.NORTH:
         # Check if the object is anywhere due North of Pacman before a
         # wall intervenes.
         next = (pacman_x, pacman_y + 1)
-        while not next in wallList:
+        while not next in wallSet:
             if next == object:
                 return True
             else:
@@ -284,7 +312,7 @@ def inFront(object, facing, state):
         # Check if the object is anywhere due North of Pacman before a
         # wall intervenes.
         next = (pacman_x, pacman_y - 1)
-        while not next in wallList:
+        while not next in wallSet:
             if next == object:
                 return True
             else:
@@ -296,7 +324,7 @@ def inFront(object, facing, state):
         # Check if the object is anywhere due East of Pacman before a
         # wall intervenes.
         next = (pacman_x + 1, pacman_y)
-        while not next in wallList:
+        while not next in wallSet:
             if next == object:
                 return True
             else:
@@ -308,7 +336,7 @@ def inFront(object, facing, state):
         # Check if the object is anywhere due West of Pacman before a
         # wall intervenes.
         next = (pacman_x - 1, pacman_y)
-        while not next in wallList:
+        while not next in wallSet:
             if next == object:
                 return True
             else:
@@ -347,6 +375,36 @@ def atSide(object, facing, state):
     else:
         return False
     
+def visibleCells(state):
+    # Returns the cells that Pacman can see, looked up in the
+    # visibility index of the layout.
+    #
+    # If Pacman is moving, these are the cells in front up to
+    # "visibilityLimit" away, and the cells in side corridors up to
+    # "sideLimit" away. If Pacman is not moving, they can see up to
+    # "visibilityLimit" in all directions.
+    #
+    # Unfortunately facing will never have value Directions.STOP
+    # after the first move is made, so the second case only happens
+    # before the first move :-(
+
+    x, y = state.getPacmanPosition()
+    facing = state.getPacmanState().configuration.direction
+    views = layoutViews(state)
+    if views['visibility'] is None:
+        layout = state.data.layout
+        layout.initializeVisibilityMatrix()
+        views['visibility'] = layout.visibility
+    cells = views['visibility'][int(x)][int(y)]
+
+    if facing == Directions.STOP:
+        return (cells[Directions.NORTH][:visibilityLimit] + cells[Directions.SOUTH][:visibilityLimit] +
+                cells[Directions.EAST][:visibilityLimit] + cells[Directions.WEST][:visibilityLimit])
+
+    return (cells[facing][:visibilityLimit] +
+            cells[Directions.LEFT[facing]][:sideLimit] +
+            cells[Directions.RIGHT[facing]][:sideLimit])
+
 def visible(objects, state):
     # When passed a list of objects, returns those that are visible to
     # Pacman.
@@ -356,50 +414,15 @@ def visible(objects, state):
         return objects
 
     # This code creates partial observability by only returning some
-    # of the members of objects.
+    # of the members of objects: those in the cells Pacman can see.
     else:
-        facing = state.getPacmanState().configuration.direction
+        objectsAt = {}
+        for object in objects:
+            objectsAt.setdefault(object, []).append(object)
         visibleObjects = []
-        sideObjects = []
-        
-        if facing != Directions.STOP:
-            
-            # If Pacman is moving, visible objects are those in front of,
-            # and to the side (if there are any side corridors).
-            
-            # Objects in front. Visible up to "visibilityLimit"
-            for i in range(len(objects)):
-                if inFront(objects[i], facing, state):
-                    visibleObjects.append(objects[i])
-            visibleObjects = distanceLimited(visibleObjects, state, visibilityLimit)
-            
-            # Objects to the side. Visible up to "sideLimit"
-            for i in range(len(objects)):
-                if atSide(objects[i], facing, state):
-                    sideObjects.append(objects[i])
-            sideObjects = distanceLimited(sideObjects, state, sideLimit)
-
-            # Combine lists.
-            visibleObjects = visibleObjects + sideObjects
-        
-        else:
-
-            # If Pacman is not moving, they can see in all directions.
-            #
-            # Unfortunately facing will never have value Directions.STOP
-            # after the first move is made, so this code will not run
-            # after the first move :-(
-
-            for i in range(len(objects)):
-                if inFront(objects[i], Directions.NORTH, state):
-                    visibleObjects.append(objects[i])
-                if inFront(objects[i], Directions.SOUTH, state):
-                    visibleObjects.append(objects[i])
-                if inFront(objects[i], Directions.EAST, state):
-                    visibleObjects.append(objects[i])
-                if inFront(objects[i], Directions.WEST, state):
-                    visibleObjects.append(objects[i])
-            visibleObjects = distanceLimited(visibleObjects, state, visibilityLimit)
+        for cell in visibleCells(state):
+            if cell in objectsAt:
+                visibleObjects.extend(objectsAt[cell])
         return visibleObjects
 
 def audible(ghosts, state):
@@ -0,0 +1,513 @@
+# batch.py
+# --------
+# Many games of one layout played in lockstep, for evaluating policies
+# over thousands of games without a GameState per ply.
+#
+# A BatchSimulator keeps the state of all its games in flat lists indexed
+# by game: a position, direction and scared timer list for each agent, a
+# score, win and lose list, and a bytearray of food and one of capsules
+# per game with a byte for every cell. Each call of step makes one ply in
+# every running game, all for the same agent, following the same rules as
+# PacmanRules and GhostRules in pacman.py.
+#
+# Positions are kept in half cells, so (3, 4.5) is (6, 9). Scared ghosts
+# move half a cell at a time, so this keeps every position an integer,
+# and COLLISION_TOLERANCE and nearestPoint become exact integer tests.
+#
+# Legal moves come from tables made once per layout: for each grid point,
+# the directions out of it, and for each half cell and direction a ghost
+# arrives in, the directions the ghost may take. Between grid points an
+# agent can only carry on the way it is going.
+#
+# RandomGhostPolicy and DirectionalGhostPolicy, both GhostPolicy
+# subclasses, choose the moves of every ghost in every game in one call,
+# for BatchSimulator.playRounds, from the same distributions as
+# RandomGhost and DirectionalGhost, which checkGhostPolicy compares them
+# with (python benchmarks.py batchGhosts).
+#
+# checkConformance replays games played through ClassicGameRules with
+# both GameState and a BatchSimulator and compares them after every ply:
+#
+#   python benchmarks.py batch -l mediumClassic,originalClassic -g 100
+
+import random
+
+from game import Actions, Directions
+from pacman import GameState, ClassicGameRules, PacmanRules, GhostRules
+from pacman import SCARED_TIME, COLLISION_TOLERANCE, TIME_PENALTY
+
+# The directions, numbered in the order GameState lists legal actions.
+DIRECTIONS = [direction for direction, vector in Actions._directionsAsList]
+DIRECTION_CODES = dict([(direction, code) for code, direction in enumerate(DIRECTIONS)])
+NUM_DIRECTIONS = len(DIRECTIONS)
+STOP = DIRECTION_CODES[Directions.STOP]
+REVERSE = [DIRECTION_CODES[Actions.reverseDirection(direction)] for direction in DIRECTIONS]
+VECTORS = [Actions._directions[direction] for direction in DIRECTIONS]
+
+# The half cell speeds of the agents.
+PACMAN_STEP = int(2 * PacmanRules.PACMAN_SPEED)
+GHOST_STEP = int(2 * GhostRules.GHOST_SPEED)
+SCARED_GHOST_STEP = int(GhostRules.GHOST_SPEED)
+COLLISION_DISTANCE = 2 * COLLISION_TOLERANCE
+
+def nearestHalf(value):
+    "nearestPoint for one half cell coordinate, in half cells."
+    return (value + 1) // 2 * 2
+
+class LayoutTables:
+    """
+    The legal move tables of a layout. Cells are numbered x * height + y,
+    and half cells x * halfHeight + y in half cells.
+
+    possible[cell] holds the directions out of a grid point, as
+    Actions.getPossibleActions gives them. ghostMoves[halfCell *
+    NUM_DIRECTIONS + direction] holds the legal actions of a ghost there
+    going that way, as GhostRules.getLegalActions gives them.
+    """
+
+    def __init__(self, layout):
+        self.width = layout.width
+        self.height = layout.height
+        self.halfHeight = 2 * self.height
+        walls = layout.walls
+        self.possible = [()] * (self.width * self.height)
+        self.ghostMoves = [()] * (4 * self.width * self.height * NUM_DIRECTIONS)
+        for halfX in range(2 * self.width):
+            for halfY in range(self.halfHeight):
+                index = (halfX * self.halfHeight + halfY) * NUM_DIRECTIONS
+                if halfX % 2 or halfY % 2:
+                    for direction in range(NUM_DIRECTIONS):
+                        self.ghostMoves[index + direction] = (direction,)
+        for x, y in walls.asList(False):
+            possible = tuple([code for code, (dx, dy) in enumerate(VECTORS) if not walls[x + dx][y + dy]])
+            self.possible[x * self.height + y] = possible
+            index = (2 * x * self.halfHeight + 2 * y) * NUM_DIRECTIONS
+            for direction in range(NUM_DIRECTIONS):
+                legal = [code for code in possible if code != STOP]
+                if REVERSE[direction] in legal and len(legal) > 1: legal.remove(REVERSE[direction])
+                self.ghostMoves[index + direction] = tuple(legal)
+
+    def getCell(self, x, y):
+        "The cell of a grid point given in half cells."
+        return x // 2 * self.height + y // 2
+
+    def getGhostMoves(self, x, y, direction):
+        "The legal actions of a ghost at (x, y), in half cells, going in direction."
+        return self.ghostMoves[(x * self.halfHeight + y) * NUM_DIRECTIONS + direction]
+
+# The tables already made, by layout hash.
+TABLE_CACHE = {}
+
+def getLayoutTables(layout):
+    key = layout.getTextHash()
+    if key not in TABLE_CACHE: TABLE_CACHE[key] = LayoutTables(layout)
+    return TABLE_CACHE[key]
+
+class BatchSimulator:
+    """
+    numGames games of one layout, played a ply at a time in all of them
+    together. Agents are numbered as in GameState, and every game has the
+    pacman and as many ghosts, up to numGhostAgents, as the layout gives.
+    """
+
+    def __init__(self, layout, numGames, numGhostAgents=1000):
+        self.layout = layout
+        self.tables = getLayoutTables(layout)
+        self.numGames = numGames
+        height = layout.height
+
+        starts = []
+        numGhosts = 0
+        for isPacman, (x, y) in layout.agentPositions:
+            if not isPacman:
+                if numGhosts == numGhostAgents: continue
+                numGhosts += 1
+            starts.append((2 * x, 2 * y))
+        self.numAgents = len(starts)
+        self.starts = starts
+        self.xs = [[x] * numGames for x, y in starts]
+        self.ys = [[y] * numGames for x, y in starts]
+        self.directions = [[STOP] * numGames for start in starts]
+        self.scaredTimers = [[0] * numGames for start in starts]
+
+        food = bytearray(layout.width * height)
+        for x, y in layout.food.asList():
+            food[x * height + y] = 1
+        capsules = bytearray(layout.width * height)
+        for x, y in layout.capsules:
+            capsules[x * height + y] = 1
+        self.food = [bytearray(food) for i in range(numGames)]
+        self.numFood = [layout.food.count()] * numGames
+        self.capsules = [bytearray(capsules) for i in range(numGames)]
+
+        self.scores = [0] * numGames
+        self.wins = [False] * numGames
+        self.losses = [False] * numGames
+        self.running = range(numGames)
+        self.agentIndex = 0
+        # Plies made so far, and those summed over all games
+        self.numPlies = 0
+        self.totalPlies = 0
+
+    def getNumAgents(self):
+        return self.numAgents
+
+    def isOver(self, game):
+        return self.wins[game] or self.losses[game]
+
+    def getLegalActions(self, agentIndex, game):
+        "The legal direction codes of an agent, in the order GameState gives them."
+        if self.isOver(game): return ()
+        x, y = self.xs[agentIndex][game], self.ys[agentIndex][game]
+        direction = self.directions[agentIndex][game]
+        if agentIndex > 0: return self.tables.getGhostMoves(x, y, direction)
+        if x % 2 or y % 2: return (direction,)
+        return self.tables.possible[self.tables.getCell(x, y)]
+
+    def step(self, actions):
+        """
+        Makes one ply, by the agent whose turn it is, in every running
+        game. actions holds a direction code for every game, which is
+        ignored for games that are over.
+        """
+        agentIndex = self.agentIndex
+        for game in self.running:
+            action = actions[game]
+            if action not in self.getLegalActions(agentIndex, game):
+                raise Exception('Illegal action %s in game %d' % (DIRECTIONS[action], game))
+        if agentIndex == 0: self.movePacman(actions)
+        else: self.moveGhost(agentIndex, actions)
+        self.totalPlies += len(self.running)
+        self.running = [game for game in self.running if not (self.wins[game] or self.losses[game])]
+        self.agentIndex = (agentIndex + 1) % self.numAgents
+        self.numPlies += 1
+
+    def movePacman(self, actions):
+        xs, ys, directions = self.xs[0], self.ys[0], self.directions[0]
+        height = self.tables.height
+        for game in self.running:
+            action = actions[game]
+            dx, dy = VECTORS[action]
+            x = xs[game] + dx * PACMAN_STEP
+            y = ys[game] + dy * PACMAN_STEP
+            xs[game], ys[game] = x, y
+            if action != STOP: directions[game] = action
+
+            # Eat
+            scoreChange = -TIME_PENALTY
+            nearestX, nearestY = nearestHalf(x), nearestHalf(y)
+            if abs(nearestX - x) + abs(nearestY - y) <= 1:
+                cell = nearestX // 2 * height + nearestY // 2
+                food = self.food[game]
+                if food[cell]:
+                    food[cell] = 0
+                    scoreChange += 10
+                    self.numFood[game] -= 1
+                    if self.numFood[game] == 0 and not self.losses[game]:
+                        scoreChange += 500
+                        self.wins[game] = True
+                capsules = self.capsules[game]
+                if capsules[cell]:
+                    capsules[cell] = 0
+                    for index in range(1, self.numAgents):
+                        self.scaredTimers[index][game] = SCARED_TIME
+
+            # Anyone can kill him
+            for index in range(1, self.numAgents):
+                if abs(self.xs[index][game] - x) + abs(self.ys[index][game] - y) <= COLLISION_DISTANCE:
+                    scoreChange += self.collide(index, game)
+            self.scores[game] += scoreChange
+
+    def moveGhost(self, agentIndex, actions):
+        xs, ys, directions = self.xs[agentIndex], self.ys[agentIndex], self.directions[agentIndex]
+        scaredTimers = self.scaredTimers[agentIndex]
+        pacmanXs, pacmanYs = self.xs[0], self.ys[0]
+        for game in self.running:
+            action = actions[game]
+            dx, dy = VECTORS[action]
+            timer = scaredTimers[game]
+            if timer > 0: step = SCARED_GHOST_STEP
+            else: step = GHOST_STEP
+            x = xs[game] + dx * step
+            y = ys[game] + dy * step
+            if action != STOP: directions[game] = action
+
+            # Time passes
+            if timer == 1: x, y = nearestHalf(x), nearestHalf(y)
+            scaredTimers[game] = max(0, timer - 1)
+            xs[game], ys[game] = x, y
+
+            scoreChange = 0
+            if abs(pacmanXs[game] - x) + abs(pacmanYs[game] - y) <= COLLISION_DISTANCE:
+                scoreChange = self.collide(agentIndex, game)
+            self.scores[game] += scoreChange
+
+    def collide(self, agentIndex, game):
+        "GhostRules.collide for one game, returning the change to its score."
+        if self.scaredTimers[agentIndex][game] > 0:
+            self.xs[agentIndex][game], self.ys[agentIndex][game] = self.starts[agentIndex]
+            self.directions[agentIndex][game] = STOP
+            self.scaredTimers[agentIndex][game] = 0
+            return 200
+        if not self.wins[game]:
+            self.losses[game] = True
+            return -500
+        return 0
+
+    def getScore(self, game):
+        return float(self.scores[game])
+
+    def getSnapshot(self, game):
+        "The state of a game in the same form getSnapshot gives a GameState."
+        height = self.tables.height
+        agents = tuple([(self.xs[i][game] / 2.0, self.ys[i][game] / 2.0,
+                         DIRECTIONS[self.directions[i][game]], self.scaredTimers[i][game])
+                        for i in range(self.numAgents)])
+        food = [(cell // height, cell % height) for cell, present in enumerate(self.food[game]) if present]
+        capsules = [(cell // height, cell % height) for cell, present in enumerate(self.capsules[game]) if present]
+        return (agents, food, capsules, self.scores[game], self.wins[game], self.losses[game])
+
+    def play(self, policies, maxPlies=None):
+        """
+        Plays every game until it ends, or until maxPlies plies. policies
+        holds, for each agent, a function that takes the simulator and the
+        agent's index and returns a direction code for every game.
+        """
+        while self.running and (maxPlies is None or self.numPlies < maxPlies):
+            self.step(policies[self.agentIndex](self, self.agentIndex))
+
+    def playRounds(self, pacmanPolicy, ghostPolicy, maxPlies=None):
+        """
+        Plays as play does, but asks ghostPolicy for the moves of all the
+        ghosts at once after each pacman move. This is the same as asking
+        each ghost in turn: the ghosts before it can only change their own
+        state, or end the game. If an earlier call stopped at maxPlies
+        part way through the ghosts' turns, those are played first.
+        """
+        while self.running and (maxPlies is None or self.numPlies < maxPlies):
+            if self.agentIndex == 0:
+                self.step(pacmanPolicy(self, 0))
+                continue
+            ghostActions = ghostPolicy.getActions(self)
+            while self.agentIndex > 0 and self.running and (maxPlies is None or self.numPlies < maxPlies):
+                self.step(ghostActions[self.agentIndex])
+
+def randomPolicy(simulator, agentIndex):
+    "Chooses uniformly among each game's legal actions, other than STOP if there is another."
+    actions = [None] * simulator.numGames
+    for game in simulator.running:
+        legal = [code for code in simulator.getLegalActions(agentIndex, game) if code != STOP]
+        if not legal: legal = [STOP]
+        actions[game] = random.choice(legal)
+    return actions
+
+#############################
+# Ghost policies            #
+#############################
+
+class GhostPolicy:
+    """
+    Chooses the moves of every ghost in every game of a BatchSimulator,
+    in one call. Subclasses define getWeights(legal, x, y, scaredTimer,
+    pacmanX, pacmanY), the unnormalized chances of each of a ghost's legal
+    actions, and may replace chooseAction with a quicker draw.
+    """
+
+    def chooseAction(self, legal, x, y, scaredTimer, pacmanX, pacmanY):
+        "Draws one of legal, two or more direction codes, by their weights."
+        weights = self.getWeights(legal, x, y, scaredTimer, pacmanX, pacmanY)
+        threshold = random.random() * sum(weights)
+        for code, weight in zip(legal, weights):
+            threshold -= weight
+            if threshold < 0: break
+        return code
+
+    def getDistribution(self, simulator, agentIndex, game):
+        "The chance of each legal action of a ghost in a game, by direction."
+        legal = simulator.getLegalActions(agentIndex, game)
+        if not legal: return {}
+        weights = self.getWeights(legal, simulator.xs[agentIndex][game], simulator.ys[agentIndex][game],
+                                  simulator.scaredTimers[agentIndex][game], simulator.xs[0][game], simulator.ys[0][game])
+        total = sum(weights)
+        return dict([(DIRECTIONS[code], weight / total) for code, weight in zip(legal, weights)])
+
+    def getActions(self, simulator):
+        """
+        The moves of every ghost in every running game, as a list by agent
+        index of lists by game.
+        """
+        tables = simulator.tables
+        ghostMoves, halfHeight = tables.ghostMoves, tables.halfHeight
+        pacmanXs, pacmanYs = simulator.xs[0], simulator.ys[0]
+        chooseAction = self.chooseAction
+        actions = [None] * simulator.numAgents
+        for agentIndex in range(1, simulator.numAgents):
+            xs, ys, directions = simulator.xs[agentIndex], simulator.ys[agentIndex], simulator.directions[agentIndex]
+            scaredTimers = simulator.scaredTimers[agentIndex]
+            ghostActions = [None] * simulator.numGames
+            for game in simulator.running:
+                x, y = xs[game], ys[game]
+                legal = ghostMoves[(x * halfHeight + y) * NUM_DIRECTIONS + directions[game]]
+                if len(legal) > 1:
+                    ghostActions[game] = chooseAction(legal, x, y, scaredTimers[game], pacmanXs[game], pacmanYs[game])
+                elif legal:
+                    ghostActions[game] = legal[0]
+                else:
+                    ghostActions[game] = STOP
+            actions[agentIndex] = ghostActions
+        return actions
+
+class RandomGhostPolicy(GhostPolicy):
+    """
+    ghostAgents.RandomGhost for all the ghosts of a BatchSimulator: each
+    chooses uniformly among its legal actions.
+    """
+
+    def getWeights(self, legal, x, y, scaredTimer, pacmanX, pacmanY):
+        return [1.0] * len(legal)
+
+    def chooseAction(self, legal, x, y, scaredTimer, pacmanX, pacmanY):
+        return legal[int(random.random() * len(legal))]
+
+class DirectionalGhostPolicy(GhostPolicy):
+    """
+    ghostAgents.DirectionalGhost for all the ghosts of a BatchSimulator:
+    each prefers the moves that take it closest to pacman or, when scared,
+    furthest from him.
+    """
+
+    def __init__(self, probAttack=0.8, probScaredFlee=0.8):
+        self.probAttack = probAttack
+        self.probScaredFlee = probScaredFlee
+
+    def getWeights(self, legal, x, y, scaredTimer, pacmanX, pacmanY):
+        "The chances of each of legal, as DirectionalGhost.getDistribution works them out."
+        if scaredTimer > 0:
+            step = SCARED_GHOST_STEP
+        else:
+            step = GHOST_STEP
+        distances = [abs(x + VECTORS[code][0] * step - pacmanX) + abs(y + VECTORS[code][1] * step - pacmanY)
+                     for code in legal]
+        if scaredTimer > 0:
+            bestDistance = max(distances)
+            bestProb = self.probScaredFlee
+        else:
+            bestDistance = min(distances)
+            bestProb = self.probAttack
+        otherWeight = (1 - bestProb) / len(legal)
+        bestWeight = bestProb / distances.count(bestDistance) + otherWeight
+        weights = []
+        for distance in distances:
+            if distance == bestDistance: weights.append(bestWeight)
+            else: weights.append(otherWeight)
+        return weights
+
+#############################
+# Conformance               #
+#############################
+
+def getSnapshot(state):
+    "The parts of a GameState a BatchSimulator keeps, to compare them."
+    agents = tuple([(agentState.configuration.pos[0], agentState.configuration.pos[1],
+                     agentState.configuration.direction, agentState.scaredTimer)
+                    for agentState in state.data.agentStates])
+    return (agents, sorted(state.getFood().asList()), sorted(state.getCapsules()),
+            state.data.score, state.isWin(), state.isLose())
+
+def recordGames(layout, numGames, seed):
+    """
+    Plays numGames games through ClassicGameRules, with a DirectionalGhost
+    for every ghost of the layout, and returns the (agentIndex, action)
+    pairs of each. Pacman plays at random in even games, and as a
+    GreedyAgent in odd ones, which eats capsules and so scares the ghosts.
+    """
+    import textDisplay
+    from sampleAgents import RandomAgent
+    from pacmanAgents import GreedyAgent
+    from ghostAgents import DirectionalGhost
+    random.seed(seed)
+    rules = ClassicGameRules()
+    histories = []
+    for i in range(numGames):
+        pacman = [RandomAgent, GreedyAgent][i % 2]()
+        ghosts = [DirectionalGhost(index + 1) for index in range(layout.getNumGhosts())]
+        game = rules.newGame(layout, pacman, ghosts, textDisplay.NullGraphics(), quiet=True)
+        game.run()
+        histories.append(game.moveHistory)
+    return histories
+
+def checkConformance(layout, histories):
+    """
+    Replays games given as lists of (agentIndex, action) pairs, all from
+    the start of layout with all its ghosts, both with GameState and in
+    lockstep in one BatchSimulator, comparing every game after every ply.
+    Returns the mismatches found, as (game, ply, expected, found)
+    snapshots, at most one per game.
+    """
+    numGames = len(histories)
+    simulator = BatchSimulator(layout, numGames)
+    states = []
+    for game in range(numGames):
+        state = GameState()
+        state.initialize(layout, simulator.getNumAgents() - 1)
+        states.append(state)
+    mismatches = []
+    failed = set()
+    ply = 0
+    while simulator.running:
+        actions = [None] * numGames
+        for game in simulator.running:
+            agentIndex, action = histories[game][ply]
+            actions[game] = DIRECTION_CODES[action]
+            states[game] = states[game].generateSuccessor(agentIndex, action)
+        simulator.step(actions)
+        ply += 1
+        for game in range(numGames):
+            if game in failed or ply > len(histories[game]): continue
+            expected = getSnapshot(states[game])
+            found = simulator.getSnapshot(game)
+            if expected != found or (ply == len(histories[game])) != simulator.isOver(game):
+                mismatches.append((game, ply, expected, found))
+                failed.add(game)
+                # Its recorded actions may not be legal in the simulator any more
+                if game in simulator.running: simulator.running.remove(game)
+    return mismatches
+
+def checkGhostPolicy(layout, histories, policy, ghostClass):
+    """
+    Replays games as checkConformance does. After each pacman move it asks
+    policy for the distribution of every ghost's moves, as playRounds
+    would, and compares each with the one ghostClass gives from GameState
+    when that ghost's turn comes. Returns the number of ghost moves
+    compared and the largest difference in the chance of any action.
+    """
+    numGames = len(histories)
+    simulator = BatchSimulator(layout, numGames)
+    states = []
+    for game in range(numGames):
+        state = GameState()
+        state.initialize(layout, simulator.getNumAgents() - 1)
+        states.append(state)
+    ghosts = [None] + [ghostClass(index) for index in range(1, simulator.getNumAgents())]
+    compared = 0
+    worst = 0.0
+    ply = 0
+    while simulator.running:
+        agentIndex = simulator.agentIndex
+        if agentIndex == 1:
+            expected = dict([((index, game), policy.getDistribution(simulator, index, game))
+                             for game in simulator.running for index in range(1, simulator.getNumAgents())])
+        actions = [None] * numGames
+        for game in simulator.running:
+            if agentIndex > 0:
+                found = ghosts[agentIndex].getDistribution(states[game])
+                distribution = expected[(agentIndex, game)]
+                for action in set(found.keys() + distribution.keys()):
+                    worst = max(worst, abs(found[action] - distribution.get(action, 0.0)))
+                compared += 1
+            action = histories[game][ply][1]
+            actions[game] = DIRECTION_CODES[action]
+            states[game] = states[game].generateSuccessor(agentIndex, action)
+        simulator.step(actions)
+        ply += 1
+    return compared, worst
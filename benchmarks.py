@@ -0,0 +1,601 @@
+# benchmarks.py
+# -------------
+# Benchmarks for the pacman engine and for the agents that run on it.
+#
+# Each benchmark plays fixed-seed games headless and prints a table of
+# results. To run one:
+#
+#   python benchmarks.py mdpSolvers
+#   python benchmarks.py mdpSolvers -l mediumClassic,smallClassic -m 50
+#   python benchmarks.py suite --json results.json
+#
+# and "python benchmarks.py -h" lists the benchmarks and options.
+
+import glob
+import json
+import os
+import random
+import sys
+import time
+
+import layout
+import util
+from game import Agent, Directions
+from pacman import GameState, ClassicGameRules
+from ghostAgents import RandomGhost, DirectionalGhost
+
+BENCHMARKS = {}
+
+def benchmark(function):
+    "Registers a benchmark under the name of its function."
+    BENCHMARKS[function.__name__] = function
+    return function
+
+def getLayoutNames(pattern):
+    """
+    Layout names are either given as a comma separated list or as a
+    glob over the layouts directory, like '*Classic'.
+    """
+    if '*' in pattern:
+        paths = glob.glob(os.path.join('layouts', pattern + '.lay'))
+        return sorted([os.path.basename(path)[:-len('.lay')] for path in paths])
+    return pattern.split(',')
+
+def playHeadless(layoutName, pacmanFunction, numMoves, seed):
+    """
+    Plays one game with random ghosts and no display, for at most
+    numMoves pacman moves. pacmanFunction is called with each state and
+    returns pacman's action.
+    """
+    random.seed(seed)
+    theLayout = layout.getLayout(layoutName)
+    state = GameState()
+    state.initialize(theLayout, theLayout.getNumGhosts())
+    ghosts = [RandomGhost(i + 1) for i in range(theLayout.getNumGhosts())]
+    moves = 0
+    while moves < numMoves and not (state.isWin() or state.isLose()):
+        state = state.generateSuccessor(0, pacmanFunction(state))
+        moves += 1
+        for ghost in ghosts:
+            if state.isWin() or state.isLose(): break
+            state = state.generateSuccessor(ghost.index, ghost.getAction(state))
+    return state, moves
+
+#############################
+# Value iteration solvers   #
+#############################
+
+MDP_SOLVERS = [('dict', {'engine': 'dict'}),
+               ('array', {'engine': 'array'}),
+               ('array+incremental', {'engine': 'array', 'incremental': True}),
+               ('prioritized', {'engine': 'prioritized'}),
+               ('prioritized+incremental', {'engine': 'prioritized', 'incremental': True})]
+
+def solveWith(agent, state):
+    "Runs one MDPAgent solve on state, returning its move and the solve time."
+    agent.setUpStates(state)
+    agent.createRewardAndUtilityMap()
+    agent.computeGhostRewards()
+    start = time.time()
+    agent.valueIteration()
+    return agent.getBestMove(), time.time() - start
+
+def makeLegalMove(agent, move):
+    "Turns the move an MDPAgent chose into the action it would take."
+    import api
+    legal = agent.legal_actions
+    if Directions.STOP in legal: legal.remove(Directions.STOP)
+    return api.makeMove(move, legal)
+
+@benchmark
+def mdpSolvers(options):
+    """
+    Backups to convergence for each MDPAgent engine. Every engine solves
+    the same states: the game is driven by the first engine's moves.
+    Residuals counts the Bellman evaluations the prioritized engine makes
+    only to order its queue.
+    """
+    from mdpAgents import MDPAgent
+
+    print '%-16s %-24s %7s %10s %10s %10s %9s' % ('Layout', 'Engine', 'Moves', 'Sweeps', 'Backups', 'Residuals', 'Time/move')
+    for layoutName in getLayoutNames(options.layouts):
+        util.mutePrint()
+        agents = [(name, MDPAgent(**args)) for name, args in MDP_SOLVERS]
+        times = dict([(name, 0.0) for name, args in MDP_SOLVERS])
+        residuals = dict([(name, 0) for name, args in MDP_SOLVERS])
+
+        def pacmanFunction(state):
+            moves = []
+            for name, agent in agents:
+                move, seconds = solveWith(agent, state)
+                times[name] += seconds
+                residuals[name] += agent.residual_count
+                moves.append(move)
+            return makeLegalMove(agents[0][1], moves[0])
+
+        try:
+            playHeadless(layoutName, pacmanFunction, options.moves, options.seed)
+        finally:
+            util.unmutePrint()
+        for name, agent in agents:
+            moveCount = float(max(agent.move_count, 1))
+            print '%-16s %-24s %7d %10.2f %10.1f %10.1f %8.2fms' % (
+                layoutName, name, agent.move_count, agent.total_sweep_count / moveCount,
+                agent.total_backup_count / moveCount, residuals[name] / moveCount,
+                1000 * times[name] / moveCount)
+
+@benchmark
+def mdpWindow(options):
+    """
+    Decision agreement between a localized window solve, for each radius
+    in --radii, and a full array solve of the same state. The game is
+    driven by the full solve.
+    """
+    from mdpAgents import MDPAgent
+
+    radii = [int(radius) for radius in options.radii.split(',')]
+    print '%-16s %-8s %7s %10s %10s %9s' % ('Layout', 'Radius', 'Moves', 'Agreement', 'Backups', 'Time/move')
+    for layoutName in getLayoutNames(options.layouts):
+        util.mutePrint()
+        full = MDPAgent(engine='array')
+        windows = [(radius, MDPAgent(engine='array', radius=radius)) for radius in radii]
+        agreements = dict([(radius, 0) for radius in radii])
+        times = dict([(radius, 0.0) for radius in [0] + radii])
+
+        def pacmanFunction(state):
+            fullMove, seconds = solveWith(full, state)
+            times[0] += seconds
+            for radius, agent in windows:
+                move, seconds = solveWith(agent, state)
+                times[radius] += seconds
+                if move == fullMove: agreements[radius] += 1
+            return makeLegalMove(full, fullMove)
+
+        try:
+            playHeadless(layoutName, pacmanFunction, options.moves, options.seed)
+        finally:
+            util.unmutePrint()
+        moveCount = float(max(full.move_count, 1))
+        print '%-16s %-8s %7d %9.1f%% %10.1f %8.2fms' % (
+            layoutName, 'full', full.move_count, 100.0,
+            full.total_backup_count / moveCount, 1000 * times[0] / moveCount)
+        for radius, agent in windows:
+            print '%-16s %-8d %7d %9.1f%% %10.1f %8.2fms' % (
+                layoutName, radius, agent.move_count, 100 * agreements[radius] / moveCount,
+                agent.total_backup_count / moveCount, 1000 * times[radius] / moveCount)
+
+#############################
+# Game engine               #
+#############################
+
+def randomPacman(state):
+    legal = state.getLegalPacmanActions()
+    legal.remove(Directions.STOP)
+    return random.choice(legal)
+
+def timeSuccessors(states, repeats=3):
+    """
+    Generates every legal successor of every agent in each of states, and
+    returns the number generated and the best time of repeats runs.
+    """
+    best = None
+    for i in range(repeats):
+        count = 0
+        start = time.time()
+        for state in states:
+            for agentIndex in range(state.getNumAgents()):
+                for action in state.getLegalActions(agentIndex):
+                    state.generateSuccessor(agentIndex, action)
+                    count += 1
+        seconds = time.time() - start
+        if best is None or seconds < best: best = seconds
+    return count, best
+
+@benchmark
+def successors(options):
+    """
+    Successors generated per second, over the states of a game played by a
+    random pacman, for each GameState explored mode.
+    """
+    modes = GameState.EXPLORED_MODES
+    print '%-16s %7s %11s' % ('Layout', 'States', 'Successors') + ''.join([' %10s' % mode for mode in modes])
+    for layoutName in getLayoutNames(options.layouts):
+        states = []
+        def pacmanFunction(state):
+            states.append(state)
+            return randomPacman(state)
+        playHeadless(layoutName, pacmanFunction, options.moves, options.seed)
+        states = [state for state in states if not (state.isWin() or state.isLose())]
+
+        rates = []
+        exploredMode, sampleSize = GameState.exploredMode, GameState.exploredSampleSize
+        try:
+            for mode in modes:
+                GameState.setExploredMode(mode)
+                count, seconds = timeSuccessors(states)
+                rates.append(count / seconds)
+        finally:
+            GameState.setExploredMode(exploredMode, sampleSize)
+        print '%-16s %7d %11d' % (layoutName, len(states), count) + ''.join([' %10.0f' % rate for rate in rates])
+
+@benchmark
+def observations(options):
+    """
+    The time Game.run spends copying the state into an observation for the
+    agent about to move, per ply, over a game played by a random pacman
+    against all of the layout's ghosts.
+    """
+    print '%-16s %7s %7s %14s' % ('Layout', 'Agents', 'Plies', 'Time/ply')
+    for layoutName in getLayoutNames(options.layouts):
+        states = []
+        def pacmanFunction(state):
+            states.append(state)
+            return randomPacman(state)
+        playHeadless(layoutName, pacmanFunction, options.moves, options.seed)
+
+        best = None
+        for i in range(3):
+            start = time.time()
+            for state in states:
+                for agentIndex in range(state.getNumAgents()):
+                    state.deepCopy()
+            seconds = time.time() - start
+            if best is None or seconds < best: best = seconds
+        plies = len(states) * states[0].getNumAgents()
+        print '%-16s %7d %7d %12.1fus' % (layoutName, states[0].getNumAgents(), plies, 1e6 * best / plies)
+
+def objectSize(obj):
+    "The bytes an instance takes, including its attribute dictionary if it has one."
+    size = sys.getsizeof(obj)
+    if hasattr(obj, '__dict__'): size += sys.getsizeof(obj.__dict__)
+    return size
+
+@benchmark
+def agentStates(options):
+    """
+    Throughput of --games headless games with a random pacman, and the
+    Configuration and AgentState objects the engine makes per pacman move,
+    counted over the first few games, with the bytes each one takes.
+    """
+    import game
+    classes = [game.Configuration, game.AgentState]
+    counts = dict([(cls, 0) for cls in classes])
+
+    def countInstances(cls, init):
+        def countingInit(self, *args):
+            counts[cls] += 1
+            init(self, *args)
+        return countingInit
+
+    configuration = game.Configuration((1, 1), Directions.STOP)
+    print 'Bytes per Configuration: %d, per AgentState: %d' % (
+        objectSize(configuration), objectSize(game.AgentState(configuration, True)))
+    print '%-16s %7s %9s %11s %15s %12s' % ('Layout', 'Games', 'Moves', 'Moves/sec', 'Configs/move', 'States/move')
+    for layoutName in getLayoutNames(options.layouts):
+        moves = 0
+        start = time.time()
+        for i in range(options.games):
+            state, gameMoves = playHeadless(layoutName, randomPacman, options.moves, '%s-%d' % (options.seed, i))
+            moves += gameMoves
+        seconds = time.time() - start
+
+        inits = dict([(cls, cls.__dict__['__init__']) for cls in classes])
+        countedMoves = 0
+        try:
+            for cls in classes:
+                counts[cls] = 0
+                cls.__init__ = countInstances(cls, inits[cls])
+            for i in range(min(options.games, 20)):
+                state, gameMoves = playHeadless(layoutName, randomPacman, options.moves, '%s-%d' % (options.seed, i))
+                countedMoves += gameMoves
+        finally:
+            for cls in classes:
+                cls.__init__ = inits[cls]
+        print '%-16s %7d %9d %11.0f %15.2f %12.2f' % (layoutName, options.games, moves, moves / seconds,
+            counts[game.Configuration] / float(countedMoves), counts[game.AgentState] / float(countedMoves))
+
+#############################
+# Regression suite          #
+#############################
+
+API_SENSORS = ['whereAmI', 'legalActions', 'ghosts', 'ghostStates', 'ghostStatesWithTimes',
+               'capsules', 'food', 'walls', 'corners']
+
+class RecordingPacman(Agent):
+    "A random pacman that keeps every state it is shown."
+
+    def __init__(self):
+        self.states = []
+
+    def getAction(self, state):
+        self.states.append(state)
+        return randomPacman(state)
+
+class LimitedRules(ClassicGameRules):
+    "Classic rules, except that the game also ends after maxMoves pacman moves."
+
+    def __init__(self, maxMoves):
+        ClassicGameRules.__init__(self)
+        self.maxMoves = maxMoves
+
+    def process(self, state, game):
+        ClassicGameRules.process(self, state, game)
+        if len(game.moveHistory) >= self.maxMoves * state.getNumAgents():
+            game.gameOver = True
+
+def runGame(layoutName, numMoves, seed, ghostClass=RandomGhost):
+    """
+    Plays one game through Game.run with a random pacman, ghosts of
+    ghostClass and no display, for at most numMoves pacman moves. Returns
+    the game, the wall clock time it took and the states pacman was shown.
+    """
+    import textDisplay
+    random.seed(seed)
+    theLayout = layout.getLayout(layoutName)
+    pacman = RecordingPacman()
+    ghosts = [ghostClass(i + 1) for i in range(theLayout.getNumGhosts())]
+    rules = LimitedRules(numMoves)
+    game = rules.newGame(theLayout, pacman, ghosts, textDisplay.NullGraphics(), quiet=True)
+    start = time.time()
+    game.run()
+    return game, time.time() - start, pacman.states
+
+def timeSensors(states, repeats=3):
+    "The best time of repeats runs, per call, of each api sensor over states."
+    import api
+    times = {}
+    for name in API_SENSORS:
+        sensor = getattr(api, name)
+        best = None
+        for i in range(repeats):
+            start = time.time()
+            for state in states:
+                sensor(state)
+            seconds = time.time() - start
+            if best is None or seconds < best: best = seconds
+        times[name] = best / len(states)
+    return times
+
+def timeMDPAgent(states, seed):
+    "The time MDPAgent.getAction takes on each of states, in order."
+    from mdpAgents import MDPAgent
+    random.seed(seed)
+    util.mutePrint()
+    try:
+        agent = MDPAgent()
+        agent.registerInitialState(states[0])
+        times = []
+        for state in states:
+            start = time.time()
+            agent.getAction(state)
+            times.append(time.time() - start)
+        agent.final(states[-1])
+    finally:
+        util.unmutePrint()
+    return times
+
+@benchmark
+def suite(options):
+    """
+    The engine regression suite, for every layout in layouts/ unless
+    --layouts says otherwise. For each layout it plays a seeded game
+    through Game.run with a random pacman and random ghosts, and over the
+    states pacman saw measures: successors generated per second, the time
+    Game.run spends per move outside the agents, the time per call of each
+    api sensor, and MDPAgent.getAction latency over the first --mdpMoves
+    states. The results are also written as JSON to --json, if given, so
+    that runs can be compared.
+    """
+    layoutNames = getLayoutNames(options.layouts or '*')
+    results = {'seed': options.seed, 'moves': options.moves, 'mdpMoves': options.mdpMoves,
+               'python': sys.version.split()[0], 'layouts': {}}
+    print '%-22s %6s %7s %11s %13s %12s %12s %12s' % ('Layout', 'Agents', 'Moves', 'Succ/sec',
+        'Overhead/ply', 'Sensors/call', 'MDP mean', 'MDP max')
+    for layoutName in layoutNames:
+        game, seconds, states = runGame(layoutName, options.moves, options.seed)
+        plies = len(game.moveHistory)
+        overhead = (seconds - sum(game.totalAgentTimes)) / max(plies, 1)
+
+        states = [state for state in states if not (state.isWin() or state.isLose())]
+        count, successorSeconds = timeSuccessors(states)
+        sensors = timeSensors(states)
+        mdpTimes = timeMDPAgent(states[:options.mdpMoves], options.seed)
+
+        results['layouts'][layoutName] = {
+            'agents': game.state.getNumAgents(),
+            'moves': len(states),
+            'plies': plies,
+            'successorsPerSecond': count / successorSeconds,
+            'runOverheadPerPly': overhead,
+            'sensorsPerCall': sensors,
+            'mdpGetAction': {'moves': len(mdpTimes),
+                             'mean': sum(mdpTimes) / len(mdpTimes),
+                             'max': max(mdpTimes)}}
+        print '%-22s %6d %7d %11.0f %11.1fus %10.1fus %10.2fms %10.2fms' % (layoutName,
+            game.state.getNumAgents(), len(states), count / successorSeconds, 1e6 * overhead,
+            1e6 * sum(sensors.values()) / len(sensors), 1000 * sum(mdpTimes) / len(mdpTimes),
+            1000 * max(mdpTimes))
+
+    if options.json:
+        f = open(options.json, 'w')
+        try:
+            json.dump(results, f, indent=2, sort_keys=True)
+        finally:
+            f.close()
+
+@benchmark
+def observers(options):
+    """
+    Plies per second of --games games played through Game.run by a random
+    pacman against each kind of ghost, with the ghosts given a copy of the
+    state every move, and with them sharing the game's state as read-only
+    observers. Both play the same seeds, and Same says whether every game
+    ended with the same moves.
+    """
+    print '%-16s %-18s %7s %9s %12s %12s %8s %5s' % ('Layout', 'Ghosts', 'Agents', 'Plies',
+        'Copied', 'Shared', 'Speedup', 'Same')
+    for layoutName in getLayoutNames(options.layouts):
+        for ghostClass in [RandomGhost, DirectionalGhost]:
+            rates = []
+            histories = []
+            readOnlyObserver = ghostClass.readOnlyObserver
+            try:
+                for readOnly in [False, True]:
+                    ghostClass.readOnlyObserver = readOnly
+                    plies = 0
+                    seconds = 0.0
+                    history = []
+                    for i in range(options.games):
+                        game, gameSeconds, states = runGame(layoutName, options.moves,
+                                                            '%s-%d' % (options.seed, i), ghostClass)
+                        plies += len(game.moveHistory)
+                        seconds += gameSeconds
+                        history.append(game.moveHistory)
+                    rates.append(plies / seconds)
+                    histories.append(history)
+            finally:
+                ghostClass.readOnlyObserver = readOnlyObserver
+            print '%-16s %-18s %7d %9d %10.0f/s %10.0f/s %7.2fx %5s' % (layoutName, ghostClass.__name__,
+                game.state.getNumAgents(), plies, rates[0], rates[1], rates[1] / rates[0],
+                histories[0] == histories[1])
+
+def playRandomly(layoutName, numGames, maxPlies, seed, ghostClass=None):
+    """
+    Plays numGames games with GameState, for at most maxPlies plies each,
+    and returns the plies played. Every agent chooses at random as
+    batch.randomPolicy does, except that ghosts are ghostClass agents if
+    it is given.
+    """
+    random.seed(seed)
+    theLayout = layout.getLayout(layoutName)
+    ghosts = []
+    if ghostClass is not None:
+        ghosts = [None] + [ghostClass(i + 1) for i in range(theLayout.getNumGhosts())]
+    plies = 0
+    for i in range(numGames):
+        state = GameState()
+        state.initialize(theLayout, theLayout.getNumGhosts())
+        agentIndex = 0
+        gamePlies = 0
+        while gamePlies < maxPlies and not (state.isWin() or state.isLose()):
+            if agentIndex > 0 and ghosts:
+                action = ghosts[agentIndex].getAction(state)
+            else:
+                legal = state.getLegalActions(agentIndex)
+                if len(legal) > 1 and Directions.STOP in legal: legal.remove(Directions.STOP)
+                action = random.choice(legal)
+            state = state.generateSuccessor(agentIndex, action)
+            agentIndex = (agentIndex + 1) % state.getNumAgents()
+            gamePlies += 1
+        plies += gamePlies
+    return plies
+
+@benchmark
+def batch(options):
+    """
+    The batched simulator in batch.py. Mismatches counts the games, of
+    --games played through ClassicGameRules, that BatchSimulator did not
+    replay ply for ply the same as GameState, on layouts with ghosts to
+    end the games. The rest plays --games
+    random games of at most --moves rounds both with GameState and in one
+    BatchSimulator, and gives the plies per second of each.
+    """
+    import batch as batchModule
+    print '%-16s %7s %10s %9s %14s %14s %8s' % ('Layout', 'Games', 'Mismatches', 'Plies',
+        'GameState', 'Batch', 'Speedup')
+    for layoutName in getLayoutNames(options.layouts):
+        theLayout = layout.getLayout(layoutName)
+        mismatches = '-'
+        if theLayout.getNumGhosts() > 0:
+            histories = batchModule.recordGames(theLayout, options.games, options.seed)
+            mismatches = len(batchModule.checkConformance(theLayout, histories))
+
+        maxPlies = options.moves * (theLayout.getNumGhosts() + 1)
+        start = time.time()
+        plies = playRandomly(layoutName, options.games, maxPlies, options.seed)
+        stateSeconds = time.time() - start
+
+        random.seed(options.seed)
+        start = time.time()
+        simulator = batchModule.BatchSimulator(theLayout, options.games)
+        policies = [batchModule.randomPolicy] * simulator.getNumAgents()
+        simulator.play(policies, maxPlies)
+        batchSeconds = time.time() - start
+        batchPlies = simulator.totalPlies
+
+        print '%-16s %7d %10s %9d %12.0f/s %12.0f/s %7.2fx' % (layoutName, options.games, mismatches,
+            batchPlies, plies / stateSeconds, batchPlies / batchSeconds,
+            (batchPlies / batchSeconds) / (plies / stateSeconds))
+
+@benchmark
+def batchGhosts(options):
+    """
+    The batched ghost policies in batch.py against the ghost agents they
+    copy, on layouts with ghosts. Difference is the largest difference in
+    the chance of any move between the two, over the ghost moves of
+    --games games played through ClassicGameRules. The rest plays --games
+    games of at most --moves rounds, with a random pacman, both with
+    GameState and the ghost agents, and in one BatchSimulator with the
+    policy choosing for every ghost at once, and gives the plies per
+    second of each.
+    """
+    import batch as batchModule
+    from ghostAgents import RandomGhost, DirectionalGhost
+    ghostKinds = [(RandomGhost, batchModule.RandomGhostPolicy()),
+                  (DirectionalGhost, batchModule.DirectionalGhostPolicy())]
+    print '%-16s %-18s %9s %10s %9s %14s %14s %8s' % ('Layout', 'Ghosts', 'Compared', 'Difference',
+        'Plies', 'GameState', 'Batch', 'Speedup')
+    for layoutName in getLayoutNames(options.layouts):
+        theLayout = layout.getLayout(layoutName)
+        if theLayout.getNumGhosts() == 0: continue
+        histories = batchModule.recordGames(theLayout, options.games, options.seed)
+        maxPlies = options.moves * (theLayout.getNumGhosts() + 1)
+        for ghostClass, policy in ghostKinds:
+            compared, difference = batchModule.checkGhostPolicy(theLayout, histories, policy, ghostClass)
+
+            start = time.time()
+            plies = playRandomly(layoutName, options.games, maxPlies, options.seed, ghostClass)
+            stateSeconds = time.time() - start
+
+            random.seed(options.seed)
+            start = time.time()
+            simulator = batchModule.BatchSimulator(theLayout, options.games)
+            simulator.playRounds(batchModule.randomPolicy, policy, maxPlies)
+            batchSeconds = time.time() - start
+            batchPlies = simulator.totalPlies
+
+            print '%-16s %-18s %9d %10.2g %9d %12.0f/s %12.0f/s %7.2fx' % (layoutName, ghostClass.__name__,
+                compared, difference, batchPlies, plies / stateSeconds, batchPlies / batchSeconds,
+                (batchPlies / batchSeconds) / (plies / stateSeconds))
+
+def readCommand(argv):
+    from optparse import OptionParser
+    usageStr = """
+    USAGE:      python benchmarks.py <benchmark> <options>
+    BENCHMARKS: %s
+    """ % ', '.join(sorted(BENCHMARKS.keys()))
+    parser = OptionParser(usageStr)
+    parser.add_option('-l', '--layouts', dest='layouts',
+                      help='Comma separated layout names, or a glob like *Classic [Default: *Classic, or * for suite]',
+                      default=None)
+    parser.add_option('-m', '--moves', dest='moves', type='int',
+                      help='The maximum number of pacman moves per game [Default: %default]', default=100)
+    parser.add_option('-s', '--seed', dest='seed',
+                      help='The random seed for every game [Default: %default]', default='cs188')
+    parser.add_option('-g', '--games', dest='games', type='int',
+                      help='The number of games for agentStates, observers, batch and batchGhosts [Default: %default]', default=1000)
+    parser.add_option('-r', '--radii', dest='radii',
+                      help='Comma separated window radii for mdpWindow [Default: %default]', default='2,4,6,8,12')
+    parser.add_option('--mdpMoves', dest='mdpMoves', type='int',
+                      help='The number of states MDPAgent.getAction is timed on by suite [Default: %default]', default=10)
+    parser.add_option('--json', dest='json',
+                      help='Also write the results of suite as JSON to this file', default=None)
+    options, otherjunk = parser.parse_args(argv)
+    if len(otherjunk) != 1 or otherjunk[0] not in BENCHMARKS:
+        parser.error('Choose one benchmark from: ' + ', '.join(sorted(BENCHMARKS.keys())))
+    if options.layouts is None and otherjunk[0] != 'suite': options.layouts = '*Classic'
+    return BENCHMARKS[otherjunk[0]], options
+
+if __name__ == '__main__':
+    benchmarkFunction, options = readCommand(sys.argv[1:])
+    benchmarkFunction(options)
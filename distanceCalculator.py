@@ -0,0 +1,153 @@
+# distanceCalculator.py
+# ---------------------
+# Shortest path distances through the maze between every pair of free
+# cells of a layout.
+#
+# The distances are found with a breadth first search from every free
+# cell, and kept in one array of unsigned shorts indexed by
+# source * numCells + target, where cells are numbered in the order
+# Grid.asList gives them. A layout's distances are worked out once per
+# process and also saved under CACHE_DIRECTORY, named by the hash of the
+# layout text, so later runs just load them.
+#
+# Use Layout.getMazeDistance or api.mazeDistance rather than this module.
+
+import array
+import os
+import struct
+import sys
+
+import util
+
+UNREACHABLE = 0xFFFF
+
+CACHE_DIRECTORY = os.path.join(util.CACHE_DIRECTORY, 'distances')
+CACHE_MAGIC = 'PACDIST1'
+CACHE_HEADER = '<8sI'
+
+# Set to False to neither read nor write the cache files. Unlike the
+# layout cache, this one is on by default: searching from every cell
+# takes tens of milliseconds on the larger layouts, where loading the
+# file takes well under one.
+useDiskCache = True
+
+# Distancers already made in this process, by layout hash.
+DISTANCER_CACHE = {}
+
+def getDistancer(layout):
+    "The Distancer for a layout, shared by every layout with the same text."
+    key = layout.getTextHash()
+    if key not in DISTANCER_CACHE:
+        distancer = None
+        if useDiskCache: distancer = loadDistancer(layout, key)
+        if distancer is None:
+            distancer = Distancer(layout)
+            if useDiskCache: saveDistancer(distancer, key)
+        DISTANCER_CACHE[key] = distancer
+    return DISTANCER_CACHE[key]
+
+def getCachePath(key):
+    return os.path.join(CACHE_DIRECTORY, key + '.dist')
+
+def loadDistancer(layout, key):
+    "Reads a layout's distances from the cache, or returns None if they are not there."
+    try:
+        f = open(getCachePath(key), 'rb')
+    except IOError:
+        return None
+    try:
+        header = f.read(struct.calcsize(CACHE_HEADER))
+        data = f.read()
+    finally:
+        f.close()
+    if len(header) != struct.calcsize(CACHE_HEADER): return None
+    magic, numCells = struct.unpack(CACHE_HEADER, header)
+    distances = array.array('H')
+    if magic != CACHE_MAGIC or len(data) != numCells * numCells * distances.itemsize: return None
+    distances.fromstring(data)
+    if sys.byteorder == 'big': distances.byteswap()
+    distancer = Distancer(layout, distances)
+    if len(distancer.cells) != numCells: return None
+    return distancer
+
+def saveDistancer(distancer, key):
+    "Writes a layout's distances to the cache."
+    distances = distancer.distances
+    if sys.byteorder == 'big':
+        distances = array.array('H', distances)
+        distances.byteswap()
+    header = struct.pack(CACHE_HEADER, CACHE_MAGIC, len(distancer.cells))
+    util.writeCacheFile(getCachePath(key), header + distances.tostring())
+
+class Distancer:
+    """
+    The maze distances of one layout.
+    """
+
+    def __init__(self, layout, distances=None):
+        self.cells = layout.walls.asList(False)
+        self.numCells = len(self.cells)
+        self.index = dict([(cell, i) for i, cell in enumerate(self.cells)])
+        if distances is None: distances = self.computeDistances()
+        self.distances = distances
+
+    def computeDistances(self):
+        numCells = self.numCells
+        neighbours = []
+        for x, y in self.cells:
+            adjacent = [(x + 1, y), (x - 1, y), (x, y + 1), (x, y - 1)]
+            neighbours.append([self.index[cell] for cell in adjacent if cell in self.index])
+
+        distances = array.array('H', [UNREACHABLE]) * (numCells * numCells)
+        for source in range(numCells):
+            row = source * numCells
+            distances[row + source] = 0
+            frontier = [source]
+            distance = 0
+            while frontier:
+                distance += 1
+                nextFrontier = []
+                for cell in frontier:
+                    for neighbour in neighbours[cell]:
+                        if distances[row + neighbour] == UNREACHABLE:
+                            distances[row + neighbour] = distance
+                            nextFrontier.append(neighbour)
+                frontier = nextFrontier
+        return distances
+
+    def getDistance(self, pos1, pos2):
+        """
+        The number of moves on the shortest path from pos1 to pos2, or None
+        if there is no path. A position between two cells, where a scared
+        ghost can be, is measured through whichever cell gives the shorter
+        path.
+        """
+        source = self.index.get(pos1)
+        target = self.index.get(pos2)
+        if source is not None and target is not None:
+            distance = self.distances[source * self.numCells + target]
+            if distance == UNREACHABLE: return None
+            return distance
+
+        best = None
+        for source, sourceOffset in self.getNearbyCells(pos1):
+            for target, targetOffset in self.getNearbyCells(pos2):
+                distance = self.distances[source * self.numCells + target]
+                if distance == UNREACHABLE: continue
+                distance += sourceOffset + targetOffset
+                if best is None or distance < best: best = distance
+        return best
+
+    def getNearbyCells(self, pos):
+        "The free cells on either side of pos, with how far pos is from each."
+        x, y = pos
+        xs = [(int(x), x - int(x))]
+        if x != int(x): xs.append((int(x) + 1, int(x) + 1 - x))
+        ys = [(int(y), y - int(y))]
+        if y != int(y): ys.append((int(y) + 1, int(y) + 1 - y))
+        cells = []
+        for cellX, offsetX in xs:
+            for cellY, offsetY in ys:
+                if (cellX, cellY) in self.index:
+                    cells.append((self.index[(cellX, cellY)], offsetX + offsetY))
+        return cells
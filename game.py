@@ -35,7 +35,13 @@ class Agent:
     following methods which will be called if they exist:
 
     def registerInitialState(self, state): # inspects the starting state
+
+    An agent that never changes the states it is given can set
+    readOnlyObserver, and will then be given the game's own state each
+    move rather than a copy of it.
     """
+    readOnlyObserver = False
+
     def __init__(self, index=0):
         self.index = index
 
@@ -67,18 +73,30 @@ class Directions:
                WEST: EAST,
                STOP: STOP}
 
-class Configuration:
+class Configuration(object):
     """
     A Configuration holds the (x,y) coordinate of a character, along with its
     traveling direction.
 
     The convention for positions, like a graph, is that (0,0) is the lower left corner, x increases
     horizontally and y increases vertically.  Therefore, north is the direction of increasing y, or (0,1).
+
+    Configurations are never changed once made, so they are shared between
+    states and their hash is cached.
     """
+    __slots__ = ('pos', 'direction', '_hash')
 
     def __init__(self, pos, direction):
         self.pos = pos
         self.direction = direction
+        self._hash = None
+
+    def __getstate__(self):
+        return (self.pos, self.direction)
+
+    def __setstate__(self, state):
+        self.pos, self.direction = state
+        self._hash = None
 
     def getPosition(self):
         return (self.pos)
@@ -95,9 +113,11 @@ class Configuration:
         return (self.pos == other.pos and self.direction == other.direction)
 
     def __hash__(self):
-        x = hash(self.pos)
-        y = hash(self.direction)
-        return hash(x + 13 * y)
+        if self._hash is None:
+            x = hash(self.pos)
+            y = hash(self.direction)
+            self._hash = hash(x + 13 * y)
+        return self._hash
 
     def __str__(self):
         return "(x,y)="+str(self.pos)+", "+str(self.direction)
@@ -117,10 +137,11 @@ class Configuration:
             direction = self.direction # There is no stop direction
         return Configuration((x + dx, y+dy), direction)
 
-class AgentState:
+class AgentState(object):
     """
     AgentStates hold the state of an agent (configuration, speed, scared, etc).
     """
+    __slots__ = ('start', 'configuration', 'isPacman', 'scaredTimer', 'numCarrying', 'numReturned')
 
     def __init__( self, startConfiguration, isPacman ):
         self.start = startConfiguration
@@ -130,6 +151,12 @@ class AgentState:
         self.numCarrying = 0
         self.numReturned = 0
 
+    def __getstate__( self ):
+        return (self.start, self.configuration, self.isPacman, self.scaredTimer, self.numCarrying, self.numReturned)
+
+    def __setstate__( self, state ):
+        self.start, self.configuration, self.isPacman, self.scaredTimer, self.numCarrying, self.numReturned = state
+
     def __str__( self ):
         if self.isPacman:
             return "Pacman: " + str( self.configuration )
@@ -161,9 +188,13 @@ class AgentState:
 
 class Grid:
     """
-    A 2-dimensional array of objects backed by a list of lists.  Data is accessed
-    via grid[x][y] where (x,y) are positions on a Pacman map with x horizontal,
-    y vertical and the origin (0,0) in the bottom left corner.
+    A 2-dimensional array of booleans backed by the bits of a single integer.
+    Data is accessed via grid[x][y] where (x,y) are positions on a Pacman map
+    with x horizontal, y vertical and the origin (0,0) in the bottom left corner.
+
+    Cell (x,y) is bit x * height + y, the same numbering packBits uses.  Since
+    integers are immutable, copies share their bits until one of them is
+    written to, and copying a grid is O(1).
 
     The __str__ method constructs an output that is oriented like a pacman board.
     """
@@ -173,57 +204,96 @@ class Grid:
 
         self.width = width
         self.height = height
-        self.data = [[initialValue for y in range(height)] for x in range(width)]
+        if initialValue:
+            self.bits = (1L << (width * height)) - 1
+        else:
+            self.bits = 0L
+        self._hash = None
+        self._columns = None
         if bitRepresentation:
             self._unpackBits(bitRepresentation)
 
     def __getitem__(self, i):
-        return self.data[i]
+        if self._columns is None:
+            self._columns = [None] * self.width
+        column = self._columns[i]
+        if column is None:
+            column = self._columns[i] = GridColumn(self, i % self.width)
+        return column
 
     def __setitem__(self, key, item):
-        self.data[key] = item
+        for y in range(self.height):
+            self._set(key * self.height + y, item[y])
+
+    def _set(self, index, value):
+        if value is not True and value is not False and value not in [False, True]:
+            raise Exception('Grids can only contain booleans')
+        if value:
+            self.bits |= 1L << index
+        else:
+            self.bits &= ~(1L << index)
+        self._hash = None
 
     def __str__(self):
-        out = [[str(self.data[x][y])[0] for x in range(self.width)] for y in range(self.height)]
+        out = [[str(self[x][y])[0] for x in range(self.width)] for y in range(self.height)]
         out.reverse()
         return '\n'.join([''.join(x) for x in out])
 
     def __eq__(self, other):
         if other == None: return False
-        return self.data == other.data
+        return self.bits == other.bits and self.width == other.width and self.height == other.height
 
     def __hash__(self):
-        # return hash(str(self))
-        base = 1
-        h = 0
-        for l in self.data:
-            for i in l:
-                if i:
-                    h += base
-                base *= 2
-        return hash(h)
+        if self._hash is None:
+            self._hash = hash(self.bits)
+        return self._hash
+
+    def __getstate__(self):
+        "The column views are rebuilt as needed, so they are not pickled."
+        state = self.__dict__.copy()
+        state['_columns'] = None
+        return state
+
+    def __setstate__(self, state):
+        "Also reads grids pickled before the bits, which kept a list of columns in data."
+        self.__dict__.update(state)
+        if 'data' in state:
+            del self.data
+            self.bits = 0L
+            for x, column in enumerate(state['data']):
+                for y, value in enumerate(column):
+                    if value: self.bits |= 1L << (x * self.height + y)
+        self._hash = None
+        self._columns = None
 
     def copy(self):
         g = Grid(self.width, self.height)
-        g.data = [x[:] for x in self.data]
+        g.bits = self.bits
+        g._hash = self._hash
         return g
 
     def deepCopy(self):
         return self.copy()
 
     def shallowCopy(self):
-        g = Grid(self.width, self.height)
-        g.data = self.data
-        return g
+        return self.copy()
 
     def count(self, item =True ):
-        return sum([x.count(item) for x in self.data])
+        trueCount = bin(self.bits).count('1')
+        if item: return trueCount
+        return self.width * self.height - trueCount
 
     def asList(self, key = True):
         list = []
-        for x in range(self.width):
-            for y in range(self.height):
-                if self[x][y] == key: list.append( (x,y) )
+        if key:
+            bits = self.bits
+        else:
+            bits = ~self.bits & ((1L << (self.width * self.height)) - 1)
+        # Walk the set bits from the lowest, which is the (x, y) order of the grid
+        while bits:
+            lowest = bits & -bits
+            list.append(self._cellIndexToPosition(lowest.bit_length() - 1))
+            bits ^= lowest
         return list
 
     def packBits(self):
@@ -274,6 +344,41 @@ class Grid:
                 bools.append(False)
         return bools
 
+class GridColumn(object):
+    """
+    A view of one column of a Grid, so that grid[x][y] reads and writes
+    the grid's bits.
+    """
+    __slots__ = ('grid', 'offset')
+
+    def __init__(self, grid, x):
+        self.grid = grid
+        self.offset = x * grid.height
+
+    def __len__(self):
+        return self.grid.height
+
+    def __getitem__(self, y):
+        if y < 0: y += self.grid.height
+        if not 0 <= y < self.grid.height: raise IndexError('Grid index out of range')
+        return (self.grid.bits >> (self.offset + y)) & 1 == 1
+
+    def __setitem__(self, y, value):
+        grid = self.grid
+        if y < 0: y += grid.height
+        if not 0 <= y < grid.height: raise IndexError('Grid index out of range')
+        if value is True:
+            grid.bits |= 1L << (self.offset + y)
+            grid._hash = None
+        else:
+            grid._set(self.offset + y, value)
+
+    def __eq__(self, other):
+        return list(self) == list(other)
+
+    def __ne__(self, other):
+        return not self == other
+
 def reconstituteGrid(bitRep):
     if type(bitRep) is not type((1,2)):
         return bitRep
@@ -372,17 +477,30 @@ class GameStateData:
     """
 
     """
-    def __init__( self, prevState = None ):
+    def __init__( self, prevState = None, shareAgentStates = False ):
         """
         Generates a new data packet by copying information from its predecessor.
+
+        With shareAgentStates, the agent states and the capsule list are shared
+        with the predecessor instead of copied.  The rules then copy an agent's
+        state with copyAgentState before changing it, and the capsule list
+        before removing a capsule from it.
         """
+        self._foodCache = None
+        self._sharedAgentStates = None
         if prevState != None:
             self.food = prevState.food.shallowCopy()
-            self.capsules = prevState.capsules[:]
-            self.agentStates = self.copyAgentStates( prevState.agentStates )
+            if shareAgentStates:
+                self.capsules = prevState.capsules
+                self.agentStates = prevState.agentStates[:]
+                self._sharedAgentStates = [True] * len( self.agentStates )
+            else:
+                self.capsules = prevState.capsules[:]
+                self.agentStates = self.copyAgentStates( prevState.agentStates )
             self.layout = prevState.layout
             self._eaten = prevState._eaten
             self.score = prevState.score
+            self._foodCache = prevState._foodCache
 
         self._foodEaten = None
         self._foodAdded = None
@@ -393,15 +511,62 @@ class GameStateData:
         self.scoreChange = 0
 
     def deepCopy( self ):
+        """
+        Copies everything that changes during a game.  The layout never
+        changes, so the copy shares it.
+        """
         state = GameStateData( self )
         state.food = self.food.deepCopy()
-        state.layout = self.layout.deepCopy()
         state._agentMoved = self._agentMoved
         state._foodEaten = self._foodEaten
         state._foodAdded = self._foodAdded
         state._capsuleEaten = self._capsuleEaten
         return state
 
+    def _getFoodCache( self ):
+        """
+        The number of food pellets, and the list of their positions once
+        it has been asked for, along with the food bits they describe.
+        Successors share the cache until food is eaten, and it is rebuilt
+        if the food grid was changed any other way.
+        """
+        if self._foodCache is None or self._foodCache[0] is not self.food.bits:
+            self._foodCache = (self.food.bits, self.food.count(), None)
+        return self._foodCache
+
+    def getNumFood( self ):
+        return self._getFoodCache()[1]
+
+    def getFoodList( self ):
+        bits, numFood, foodList = self._getFoodCache()
+        if foodList is None:
+            foodList = tuple(self.food.asList())
+            self._foodCache = (bits, numFood, foodList)
+        return list(foodList)
+
+    def eatFood( self, position ):
+        """
+        Removes the food at position, keeping the food count and list up to
+        date instead of rescanning the grid.
+        """
+        x, y = position
+        bits, numFood, foodList = self._getFoodCache()
+        self.food = self.food.copy()
+        self.food[x][y] = False
+        if foodList is not None:
+            foodList = tuple([food for food in foodList if food != position])
+        self._foodCache = (self.food.bits, numFood - 1, foodList)
+
+    def copyAgentState( self, agentIndex ):
+        """
+        Returns the state of agent agentIndex, first copying it if it is still
+        shared with the predecessor, so that it can be changed.
+        """
+        if self._sharedAgentStates is not None and self._sharedAgentStates[agentIndex]:
+            self.agentStates[agentIndex] = self.agentStates[agentIndex].copy()
+            self._sharedAgentStates[agentIndex] = False
+        return self.agentStates[agentIndex]
+
     def copyAgentStates( self, agentStates ):
         copiedStates = []
         for agentState in agentStates:
@@ -434,13 +599,11 @@ class GameStateData:
 
     def __str__( self ):
         width, height = self.layout.width, self.layout.height
-        map = Grid(width, height)
         if type(self.food) == type((1,2)):
             self.food = reconstituteGrid(self.food)
-        for x in range(width):
-            for y in range(height):
-                food, walls = self.food, self.layout.walls
-                map[x][y] = self._foodWallStr(food[x][y], walls[x][y])
+        # Grids only hold booleans, so the board is drawn on a list of lists
+        food, walls = self.food, self.layout.walls
+        map = [[self._foodWallStr(food[x][y], walls[x][y]) for y in range(height)] for x in range(width)]
 
         for agentState in self.agentStates:
             if agentState == None: continue
@@ -455,7 +618,9 @@ class GameStateData:
         for x, y in self.capsules:
             map[x][y] = 'o'
 
-        return str(map) + ("\nScore: %d\n" % self.score)
+        out = [''.join([map[x][y] for x in range(width)]) for y in range(height)]
+        out.reverse()
+        return '\n'.join(out) + ("\nScore: %d\n" % self.score)
 
     def _foodWallStr( self, hasFood, hasWall ):
         if hasFood:
@@ -527,6 +692,10 @@ class Game:
         self.moveHistory = []
         self.totalAgentTimes = [0 for agent in agents]
         self.totalAgentTimeWarnings = [0 for agent in agents]
+        # The number runGames gave the game, if it did
+        self.index = None
+        # Set to a results.GameTimings to time every ply
+        self.timings = None
         self.agentTimeout = False
         import cStringIO
         self.agentOutput = [cStringIO.StringIO() for agent in agents]
@@ -604,7 +773,9 @@ class Game:
                         self.unmute()
                         return
                 else:
+                    start_time = time.time()
                     agent.registerInitialState(self.state.deepCopy())
+                    self.totalAgentTimes[i] += time.time() - start_time
                 ## TODO: could this exceed the total time
                 self.unmute()
 
@@ -612,6 +783,7 @@ class Game:
         numAgents = len( self.agents )
 
         while not self.gameOver:
+            plyStart = time.time()
             # Fetch the next agent
             agent = self.agents[agentIndex]
             move_time = 0
@@ -636,8 +808,13 @@ class Game:
                 else:
                     observation = agent.observationFunction(self.state.deepCopy())
                 self.unmute()
+            elif getattr(agent, 'readOnlyObserver', False):
+                # Successors never change the state they came from, so it is
+                # safe to share with an agent that does not change it either
+                observation = self.state
             else:
                 observation = self.state.deepCopy()
+            observed = time.time()
 
             # Solicit an action
             action = None
@@ -683,8 +860,11 @@ class Game:
                     self.unmute()
                     return
             else:
+                start_time = time.time()
                 action = agent.getAction(observation)
+                self.totalAgentTimes[agentIndex] += time.time() - start_time
             self.unmute()
+            acted = time.time()
 
             # Execute the action
             self.moveHistory.append( (agentIndex, action) )
@@ -698,9 +878,12 @@ class Game:
                     return
             else:
                 self.state = self.state.generateSuccessor( agentIndex, action )
+            moved = time.time()
 
             # Change the display
             self.display.update( self.state.data )
+            if self.timings is not None:
+                self.timings.addPly(agentIndex, plyStart, observed, acted, moved, time.time())
             ###idx = agentIndex - agentIndex % 2 + 1
             ###self.display.update( self.state.makeObservation(idx).data )
 
@@ -36,6 +36,8 @@ class GhostAgent( Agent ):
 
 class RandomGhost( GhostAgent ):
     "A ghost that chooses a legal action uniformly at random."
+    readOnlyObserver = True
+
     def getDistribution( self, state ):
         dist = util.Counter()
         for a in state.getLegalActions( self.index ): dist[a] = 1.0
@@ -44,6 +46,8 @@ class RandomGhost( GhostAgent ):
 
 class DirectionalGhost( GhostAgent ):
     "A ghost that prefers to rush Pacman, or flee when scared."
+    readOnlyObserver = True
+
     def __init__( self, index, prob_attack=0.8, prob_scaredFlee=0.8 ):
         self.index = index
         self.prob_attack = prob_attack
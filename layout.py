@@ -13,18 +13,43 @@
 
 
 from util import manhattanDistance
+import util
 from game import Grid
+import copy
+import hashlib
+import marshal
 import os
 import random
+import string
 
 VISIBILITY_MATRIX_CACHE = {}
 
+# Layouts getLayout has loaded, by file path, as (modification time, layout).
+LAYOUT_CACHE = {}
+
+# Set useDiskCache to True to also keep parsed layouts in files under
+# CACHE_DIRECTORY, so that later runs skip parsing them. It is off by
+# default, unlike the maze distance cache in distanceCalculator.py,
+# because parsing a layout takes under a millisecond, so the files
+# only pay off when starting many short runs.
+useDiskCache = False
+CACHE_DIRECTORY = os.path.join(util.CACHE_DIRECTORY, 'layouts')
+CACHE_VERSION = 1
+
+# Translations of layout text into the bits of a Grid
+WALL_BITS = string.maketrans('%' + ''.join([chr(i) for i in range(256) if chr(i) != '%']), '1' + '0' * 255)
+FOOD_BITS = string.maketrans('.' + ''.join([chr(i) for i in range(256) if chr(i) != '.']), '1' + '0' * 255)
+
 class Layout:
     """
     A Layout manages the static information about the game board.
     """
 
-    def __init__(self, layoutText):
+    def __init__(self, layoutText, parsed=None):
+        """
+        parsed, if given, is what getParsed returned for the same text, and
+        saves parsing it again.
+        """
         self.width = len(layoutText[0])
         self.height= len(layoutText)
         self.walls = Grid(self.width, self.height, False)
@@ -32,34 +57,72 @@ class Layout:
         self.capsules = []
         self.agentPositions = []
         self.numGhosts = 0
-        self.processLayoutText(layoutText)
+        if parsed is None:
+            self.processLayoutText(layoutText)
+        else:
+            self.walls.bits, self.food.bits, capsules, agentPositions, self.numGhosts = parsed
+            self.capsules = list(capsules)
+            self.agentPositions = list(agentPositions)
         self.layoutText = layoutText
-        self.totalFood = len(self.food.asList())
+        self.totalFood = self.food.count()
         # self.initializeVisibilityMatrix()
 
     def getNumGhosts(self):
         return self.numGhosts
 
     def initializeVisibilityMatrix(self):
+        """
+        Works out, for every free cell and every direction, the cells that
+        can be seen looking that way before a wall blocks the view, nearest
+        first.  Looking in the STOP direction sees along all four.  The
+        result is shared by every layout with the same text.
+
+        self.visibility[x][y][direction] is a tuple of (x,y) positions.
+        """
         global VISIBILITY_MATRIX_CACHE
-        if reduce(str.__add__, self.layoutText) not in VISIBILITY_MATRIX_CACHE:
-            from game import Directions
-            vecs = [(-0.5,0), (0.5,0),(0,-0.5),(0,0.5)]
-            dirs = [Directions.NORTH, Directions.SOUTH, Directions.WEST, Directions.EAST]
-            vis = Grid(self.width, self.height, {Directions.NORTH:set(), Directions.SOUTH:set(), Directions.EAST:set(), Directions.WEST:set(), Directions.STOP:set()})
+        key = '\n'.join(self.layoutText)
+        if key not in VISIBILITY_MATRIX_CACHE:
+            from game import Directions, Actions
+            dirs = [Directions.NORTH, Directions.SOUTH, Directions.EAST, Directions.WEST]
+            vis = [[{} for y in range(self.height)] for x in range(self.width)]
             for x in range(self.width):
                 for y in range(self.height):
-                    if self.walls[x][y] == False:
-                        for vec, direction in zip(vecs, dirs):
-                            dx, dy = vec
-                            nextx, nexty = x + dx, y + dy
-                            while (nextx + nexty) != int(nextx) + int(nexty) or not self.walls[int(nextx)][int(nexty)] :
-                                vis[x][y][direction].add((nextx, nexty))
-                                nextx, nexty = x + dx, y + dy
-            self.visibility = vis
-            VISIBILITY_MATRIX_CACHE[reduce(str.__add__, self.layoutText)] = vis
-        else:
-            self.visibility = VISIBILITY_MATRIX_CACHE[reduce(str.__add__, self.layoutText)]
+                    if self.walls[x][y]: continue
+                    cells = vis[x][y]
+                    for direction in dirs:
+                        dx, dy = Actions.directionToVector(direction)
+                        dx, dy = int(dx), int(dy)
+                        ray = []
+                        nextx, nexty = x + dx, y + dy
+                        while 0 <= nextx < self.width and 0 <= nexty < self.height and not self.walls[nextx][nexty]:
+                            ray.append((nextx, nexty))
+                            nextx, nexty = nextx + dx, nexty + dy
+                        cells[direction] = tuple(ray)
+                    cells[Directions.STOP] = sum([cells[direction] for direction in dirs], ())
+            VISIBILITY_MATRIX_CACHE[key] = vis
+        self.visibility = VISIBILITY_MATRIX_CACHE[key]
+
+    def getParsed(self):
+        "What parsing the layout text found, in a form marshal can store."
+        return (self.walls.bits, self.food.bits, tuple(self.capsules), tuple(self.agentPositions), self.numGhosts)
+
+    def getTextHash(self):
+        "The md5 hash of the layout text, naming this layout in caches and recordings."
+        if not hasattr(self, 'textHash'):
+            self.textHash = hashlib.md5('\n'.join(self.layoutText)).hexdigest()
+        return self.textHash
+
+    def getMazeDistance(self, pos1, pos2):
+        """
+        The number of moves on the shortest path between two positions,
+        going round walls, or None if there is no path.  The distances
+        between all cells are worked out the first time they are needed
+        (see distanceCalculator.py).
+        """
+        if not hasattr(self, 'distancer'):
+            import distanceCalculator
+            self.distancer = distanceCalculator.getDistancer(self)
+        return self.distancer.getDistance(pos1, pos2)
 
     def isWall(self, pos):
         x, col = pos
@@ -83,6 +146,7 @@ class Layout:
         return pos
 
     def isVisibleFrom(self, ghostPos, pacPos, pacDirection):
+        if not hasattr(self, 'visibility'): self.initializeVisibilityMatrix()
         row, col = [int(x) for x in pacPos]
         return ghostPos in self.visibility[row][col][pacDirection]
 
@@ -90,7 +154,17 @@ class Layout:
         return "\n".join(self.layoutText)
 
     def deepCopy(self):
-        return Layout(self.layoutText[:])
+        """
+        Copies the layout without parsing its text again.  The grids copy in
+        O(1), and the text and the visibility and distance tables, which are
+        never changed, are shared.
+        """
+        layout = copy.copy(self)
+        layout.walls = self.walls.copy()
+        layout.food = self.food.copy()
+        layout.capsules = self.capsules[:]
+        layout.agentPositions = self.agentPositions[:]
+        return layout
 
     def processLayoutText(self, layoutText):
         """
@@ -104,12 +178,21 @@ class Layout:
          G - Ghost
          P - Pacman
         Other characters are ignored.
+
+        Walls and food are read for the whole board at once: reading each
+        column from the top gives its cells from the highest bit down.
         """
+        columns = [''.join(column) for column in zip(*layoutText)]
+        columns.reverse()
+        boardText = ''.join(columns)
+        self.walls.bits = long(boardText.translate(WALL_BITS), 2)
+        self.food.bits = long(boardText.translate(FOOD_BITS), 2)
         maxY = self.height - 1
         for y in range(self.height):
             for x in range(self.width):
                 layoutChar = layoutText[maxY - y][x]
-                self.processLayoutChar(x, y, layoutChar)
+                if layoutChar not in '%. ':
+                    self.processLayoutChar(x, y, layoutChar)
         self.agentPositions.sort()
         self.agentPositions = [ ( i == 0, pos) for i, pos in self.agentPositions]
 
@@ -129,21 +212,61 @@ class Layout:
             self.agentPositions.append( (int(layoutChar), (x,y)))
             self.numGhosts += 1
 def getLayout(name, back = 2):
+    """
+    Loads the layout called name, looking for it in the layouts directory
+    and then as a file, from the current directory and then up to back
+    directories above it.
+
+    Each layout file is only parsed once: later calls return the same
+    Layout, so treat it as read-only and deepCopy it to change it.
+    """
     if name.endswith('.lay'):
-        layout = tryToLoad('layouts/' + name)
-        if layout == None: layout = tryToLoad(name)
+        fileNames = [os.path.join('layouts', name), name]
     else:
-        layout = tryToLoad('layouts/' + name + '.lay')
-        if layout == None: layout = tryToLoad(name + '.lay')
-    if layout == None and back >= 0:
-        curdir = os.path.abspath('.')
-        os.chdir('..')
-        layout = getLayout(name, back -1)
-        os.chdir(curdir)
-    return layout
+        fileNames = [os.path.join('layouts', name + '.lay'), name + '.lay']
+    directory = os.path.abspath('.')
+    for i in range(back + 2):
+        for fileName in fileNames:
+            layout = tryToLoad(os.path.join(directory, fileName))
+            if layout != None: return layout
+        directory = os.path.dirname(directory)
+    return None
 
 def tryToLoad(fullname):
     if(not os.path.exists(fullname)): return None
-    f = open(fullname)
-    try: return Layout([line.strip() for line in f])
-    finally: f.close()
+    fullname = os.path.abspath(fullname)
+    modified = os.path.getmtime(fullname)
+    if fullname in LAYOUT_CACHE and LAYOUT_CACHE[fullname][0] == modified:
+        return LAYOUT_CACHE[fullname][1]
+    layout = None
+    if useDiskCache: layout = loadCachedLayout(fullname, modified)
+    if layout == None:
+        f = open(fullname)
+        try: layout = Layout([line.strip() for line in f])
+        finally: f.close()
+        if useDiskCache: saveCachedLayout(fullname, modified, layout)
+    LAYOUT_CACHE[fullname] = (modified, layout)
+    return layout
+
+def getCachePath(fullname):
+    return os.path.join(CACHE_DIRECTORY, hashlib.md5(fullname).hexdigest() + '.layout')
+
+def loadCachedLayout(fullname, modified):
+    """
+    Reads a parsed layout from the disk cache, or returns None if it is
+    not there or the layout file has changed since it was written.
+    """
+    try:
+        f = open(getCachePath(fullname), 'rb')
+        try: cached = marshal.load(f)
+        finally: f.close()
+    except (IOError, EOFError, ValueError, TypeError):
+        return None
+    version, cachedName, cachedModified, layoutText, parsed = cached
+    if version != CACHE_VERSION or cachedName != fullname or cachedModified != modified: return None
+    return Layout(list(layoutText), parsed)
+
+def saveCachedLayout(fullname, modified, layout):
+    "Writes a parsed layout to the disk cache."
+    cached = (CACHE_VERSION, fullname, modified, tuple(layout.layoutText), layout.getParsed())
+    util.writeCacheFile(getCachePath(fullname), marshal.dumps(cached))
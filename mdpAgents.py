@@ -35,6 +35,55 @@ import random
 import math
 import game
 import util
+from collections import deque
+
+# Transition tables are compiled once per layout and shared by every
+# MDPAgent, across moves and across games.
+TRANSITION_TABLE_CACHE = {}
+
+
+class TransitionTable:
+    """The motion model compiled for one layout. The free cells are
+    numbered, and for every cell we store the index of the cell reached
+    by moving N, S, E and W. A move into a wall leaves pacman in place,
+    so the 0.8/0.1/0.1 outcomes of any action are just index lookups."""
+
+    def __init__(self, width, height, wall_locations):
+        walls = set(wall_locations)
+        self.cells = [(x, y) for x in range(width) for y in range(height) if (x, y) not in walls]
+        self.index = dict([(cell, i) for i, cell in enumerate(self.cells)])
+        self.north = self.getShiftedIndices(0, 1)
+        self.south = self.getShiftedIndices(0, -1)
+        self.east = self.getShiftedIndices(1, 0)
+        self.west = self.getShiftedIndices(-1, 0)
+        # For each cell: the cells reached by moving N, S, E and W, by
+        # index and by position
+        self.neighbour_indices = zip(self.north, self.south, self.east, self.west)
+        cells = self.cells
+        self.neighbours = {}
+        for cell, (north, south, east, west) in zip(cells, self.neighbour_indices):
+            self.neighbours[cell] = (cells[north], cells[south], cells[east], cells[west])
+        # The cells whose backup reads each cell, for propagating changes
+        self.predecessors = [[] for cell in self.cells]
+        for i in range(len(self.cells)):
+            for j in set([self.north[i], self.south[i], self.east[i], self.west[i]]):
+                self.predecessors[j].append(i)
+
+    def getShiftedIndices(self, dx, dy):
+        shifted = []
+        for i, (x, y) in enumerate(self.cells):
+            shifted.append(self.index.get((x + dx, y + dy), i))
+        return shifted
+
+    def isFree(self, cell):
+        return cell in self.index
+
+
+def getTransitionTable(width, height, wall_locations):
+    key = (width, height, tuple(wall_locations))
+    if key not in TRANSITION_TABLE_CACHE:
+        TRANSITION_TABLE_CACHE[key] = TransitionTable(width, height, wall_locations)
+    return TRANSITION_TABLE_CACHE[key]
 
 
 class MDPAgent(Agent):
@@ -54,10 +103,42 @@ class MDPAgent(Agent):
     SMALL_MAP_REWARD = -6
     DEFAULT_UTILITY = 0
     SMALL_MAP_BOUNDARY = 8
+    # The solution used at the edge of a localized window is solved
+    # to this looser tolerance, and refreshed every COARSE_INTERVAL moves,
+    # or sooner when a capsule is eaten or a ghost's scared state changes
+    COARSE_EPSILON = 0.01
+    COARSE_INTERVAL = 10
+
+    ENGINES = ['dict', 'array', 'prioritized']
 
     # Constructor: this gets run when we first invoke pacman.py
-    def __init__(self):
+    # The engine can be picked from the command line, for instance
+    # -a engine=array,incremental=1 or -a engine=array,radius=6
+    def __init__(self, engine='dict', incremental=False, radius=0):
         print ("Starting up MDPAgent!")
+        if engine not in self.ENGINES:
+            raise Exception("Unknown value iteration engine: " + str(engine))
+        self.engine = engine
+        self.incremental = str(incremental).lower() in ['1', 'true', 'yes']
+        if self.incremental and engine == 'dict':
+            raise Exception("Incremental value iteration needs the array engine")
+        # A radius of 0 solves the whole map
+        self.radius = int(radius)
+        if self.radius < 0:
+            raise Exception("The window radius must be at least 1, or 0 to solve the whole map")
+        if self.radius and (engine != 'array' or self.incremental):
+            raise Exception("A localized window needs the array engine, without incremental")
+        self.coarse_utilities = None
+        self.coarse_age = 0
+        self.coarse_key = None
+        # Convergence counters: for the last move, and for the whole game
+        self.sweep_count = 0
+        self.backup_count = 0
+        self.total_sweep_count = 0
+        self.total_backup_count = 0
+        self.move_count = 0
+        # Only the prioritized engine computes residuals without backing up
+        self.residual_count = 0
         self.pacman_location = None
         self.food_locations = None
         self.corner_locations = None
@@ -68,6 +149,10 @@ class MDPAgent(Agent):
         self.utility_dictionary = {}
         self.reward_dictionary = {}
         self.ghost_locations = None
+        self.transitions = None
+        self.previous_rewards = None
+        self.previous_utilities = None
+        self.previous_active = None
 
     # Gets run after an MDPAgent object is created and once there is
     # game state to access.
@@ -79,6 +164,12 @@ class MDPAgent(Agent):
     # This is what gets run in between multiple games
     def final(self, state):
         print("Looks like the game just ended!")
+        if self.move_count > 0:
+            print("Value iteration: %.2f sweeps, %.1f backups per move" % (
+                self.total_sweep_count / float(self.move_count), self.total_backup_count / float(self.move_count)))
+        self.total_sweep_count = 0
+        self.total_backup_count = 0
+        self.move_count = 0
         self.pacman_location = None
         self.food_locations = None
         self.corner_locations = None
@@ -89,16 +180,26 @@ class MDPAgent(Agent):
         self.utility_dictionary = {}
         self.reward_dictionary = {}
         self.ghost_locations = None
+        self.transitions = None
+        self.previous_rewards = None
+        self.previous_utilities = None
+        self.previous_active = None
+        self.coarse_utilities = None
+        self.coarse_age = 0
+        self.coarse_key = None
 
     def setUpStates(self, state):
         """ This method gets the state data at once
-        and avoids repeat access """
+        and avoids repeat access. The walls only need
+        to be read once per game. """
         self.pacman_location = api.whereAmI(state)
         self.food_locations = api.food(state)
         self.capsule_locations = api.capsules(state)
         self.ghost_states = api.ghostStates(state)
-        self.wall_locations = api.walls(state)
         self.corner_locations = api.corners(state)
+        if self.transitions is None:
+            self.wall_locations = api.walls(state)
+            self.transitions = getTransitionTable(self.getWidth(), self.getHeight(), self.wall_locations)
         self.legal_actions = api.legalActions(state)
         self.ghost_locations = api.ghosts(state)
 
@@ -118,17 +219,6 @@ class MDPAgent(Agent):
                 width = self.corner_locations[i][0]
         return width + 1
 
-    def getGrid(self):
-        """This block of code gives all the
-        locations in the map currently."""
-        grid = []
-        width = self.getWidth()
-        height = self.getHeight()
-        for i in range(width):
-            for j in range(height):
-                grid.append((i, j))
-        return grid
-
     def isMapSmall(self):
         """This method checks if the map
         is considerably small."""
@@ -139,12 +229,10 @@ class MDPAgent(Agent):
         the default values first and then updates them with
         the special locations like food and capsules. This also
         takes the last available food into consideration."""
-        grid = self.getGrid()
         # Assigning default rewards and utility
-        for location in grid:
-            if location not in self.wall_locations:
-                self.utility_dictionary[location] = self.DEFAULT_UTILITY
-                self.reward_dictionary[location] = self.SMALL_MAP_REWARD if self.isMapSmall() else self.DEFAULT_REWARD
+        for location in self.transitions.cells:
+            self.utility_dictionary[location] = self.DEFAULT_UTILITY
+            self.reward_dictionary[location] = self.SMALL_MAP_REWARD if self.isMapSmall() else self.DEFAULT_REWARD
 
         # Food and capsules
         for food_location in self.food_locations:
@@ -173,7 +261,7 @@ class MDPAgent(Agent):
         return surrounding_cells
 
     def isCellNeitherWallnorGhostCell(self, cell):
-        return cell not in self.wall_locations and cell not in self.ghost_locations
+        return self.transitions.isFree(cell) and cell not in self.ghost_locations
 
     def getSurroundingCellsNotBeingObstructed(self, cells):
         return [x for x in cells if self.isCellNeitherWallnorGhostCell(x)]
@@ -185,6 +273,14 @@ class MDPAgent(Agent):
     def getDefaultReward(self):
         return self.SMALL_MAP_REWARD if self.isMapSmall() else self.DEFAULT_REWARD
 
+    def getGamma(self):
+        return self.GAMMA_SMALL_MAP if self.isMapSmall() else self.GAMMA
+
+    def getConvergenceThreshold(self, epsilon=None):
+        if epsilon is None:
+            epsilon = self.EPSILON
+        return epsilon * (1 - self.GAMMA) / self.GAMMA
+
     def getGhostReward(self):
         return self.GHOST_REWARD_SMALL_MAP if self.isMapSmall() else self.GHOST_REWARD
 
@@ -240,56 +336,55 @@ class MDPAgent(Agent):
             else:
                 self.reward_dictionary[cell] = self.SCARED_GHOST_REWARD
 
-    def compute_utility(self, cell, action_cell, perpendicular_cell1, perpendicular_cell2, util_dict):
-        """This method computes the utility of the cell.
-        This takes into consideration the reachable locations."""
-        cell_1 = cell
-        cell_2 = cell
-        cell_3 = cell
-
-        if action_cell not in self.wall_locations:
-            cell_1 = action_cell
-
-        if perpendicular_cell1 not in self.wall_locations:
-            cell_2 = perpendicular_cell1
-
-        if perpendicular_cell2 not in self.wall_locations:
-            cell_3 = perpendicular_cell2
-
-        return (0.8 * util_dict[cell_1]) + (0.1 * util_dict[cell_2]) + (0.1 * util_dict[cell_3])
+    def getActionValues(self, north, south, east, west):
+        """This is the motion model. Given the utilities of the
+        cells reached by moving N, S, E and W, it returns the
+        expected utility of each of those actions: 0.8 for the
+        intended move, and 0.1 for each perpendicular slip."""
+        return (0.8 * north + 0.1 * east + 0.1 * west,
+                0.8 * south + 0.1 * east + 0.1 * west,
+                0.8 * east + 0.1 * north + 0.1 * south,
+                0.8 * west + 0.1 * north + 0.1 * south)
 
     def getActionUtilities(self, cell, util_dict):
         """This method returns the utilities for all
-        the possible actions. N, S, E, W."""
-        x = cell[0]
-        y = cell[1]
-
-        north_cell = (x, y + 1)
-        south_cell = (x, y - 1)
-        east_cell = (x + 1, y)
-        west_cell = (x - 1, y)
-
-        utilities = []
-        utilities.append(self.compute_utility(cell, north_cell, east_cell, west_cell, util_dict))  # North
-        utilities.append(self.compute_utility(cell, south_cell, east_cell, west_cell, util_dict))  # South
-        utilities.append(self.compute_utility(cell, east_cell, north_cell, south_cell, util_dict))  # East
-        utilities.append(self.compute_utility(cell, west_cell, north_cell, south_cell, util_dict))  # West
-
-        return utilities
+        the possible actions. N, S, E, W. Moves into walls
+        were already mapped back to the cell itself."""
+        north, south, east, west = self.transitions.neighbours[cell]
+        return self.getActionValues(util_dict[north], util_dict[south], util_dict[east], util_dict[west])
 
     def getMaximumUtility(self, utilities):
         return max(utilities)
 
     def computeBellmanValue(self, reward, utility):
-        gamma = self.GAMMA_SMALL_MAP if self.isMapSmall() else self.GAMMA
-        return reward + (gamma * utility)
+        return reward + (self.getGamma() * utility)
 
     def isStateNonTerminal(self, utility, terminal_utility):
         return utility != terminal_utility
 
     def valueIteration(self):
         """This is the main method for value iteration.
-        This uses the algorithm mentioned in Russel and Norvig.
+        It hands over to the engine picked when the agent
+        was created, and keeps the convergence counters."""
+        self.sweep_count = 0
+        self.backup_count = 0
+        self.residual_count = 0
+        if self.engine == 'dict':
+            self.dictValueIteration()
+        elif self.incremental and self.previous_utilities is not None:
+            self.incrementalValueIteration()
+        elif self.engine == 'prioritized':
+            self.prioritizedValueIteration()
+        elif self.radius:
+            self.windowValueIteration()
+        else:
+            self.arrayValueIteration()
+        self.total_sweep_count += self.sweep_count
+        self.total_backup_count += self.backup_count
+        self.move_count += 1
+
+    def dictValueIteration(self):
+        """This uses the algorithm mentioned in Russel and Norvig.
         Conceptually, this method would run till the values converge
         within an acceptable noise or error."""
         terminal_utility = self.getGhostReward()  # This is used to check for terminal locations.
@@ -305,16 +400,215 @@ class MDPAgent(Agent):
                     reward = self.reward_dictionary[location]
                     self.utility_dictionary[location] = self.computeBellmanValue(reward, best_utility)
                     delta = max(delta, abs(self.utility_dictionary[location] - utility))  # Calculating the max change
+                    self.backup_count += 1
                 else:
                     self.utility_dictionary[location] = utility
-            if delta < self.EPSILON * (1 - self.GAMMA) / self.GAMMA:   # Idea: Figure 17.4 page 653 Russel and Norvig
+            self.sweep_count += 1
+            if delta < self.getConvergenceThreshold():   # Idea: Figure 17.4 page 653 Russel and Norvig
+                break
+
+    def createUtilityArrays(self):
+        """This flattens the reward and utility maps into arrays
+        indexed like the cells of the transition table. Walls have
+        no entry, so nothing is ever computed for them."""
+        terminal_utility = self.getGhostReward()
+        rewards = [self.reward_dictionary[cell] for cell in self.transitions.cells]
+        utilities = [self.utility_dictionary[cell] for cell in self.transitions.cells]
+        # Ghost positions are terminal, exactly as in dictValueIteration
+        active = [self.isStateNonTerminal(utility, terminal_utility) for utility in utilities]
+        return rewards, utilities, active
+
+    def arrayValueIteration(self, epsilon=None):
+        """Value iteration over flat arrays. Each sweep backs up
+        every cell from the utilities of the sweep before, reading
+        the cells N, S, E and W of it from the transition table.
+        This converges to the same values as dictValueIteration,
+        within EPSILON unless a looser epsilon is given."""
+        rewards, utilities, active = self.createUtilityArrays()
+        gamma = self.getGamma()
+        threshold = self.getConvergenceThreshold(epsilon)
+        getActionValues = self.getActionValues
+        neighbours = self.transitions.neighbour_indices
+        while True:
+            new_utilities = [reward + gamma * max(getActionValues(utilities[n], utilities[s], utilities[e], utilities[w]))
+                             if is_active else utility
+                             for reward, (n, s, e, w), is_active, utility in zip(rewards, neighbours, active, utilities)]
+            delta = max([abs(new - old) for new, old in zip(new_utilities, utilities)])
+            utilities = new_utilities
+            self.sweep_count += 1
+            self.backup_count += active.count(True)
+            if delta < threshold:
+                break
+        self.storeUtilityArrays(rewards, utilities, active)
+
+    def storeUtilityArrays(self, rewards, utilities, active):
+        """Copies the solved utilities back into the utility map, and
+        keeps the arrays as the starting point for the next move."""
+        for location, utility in zip(self.transitions.cells, utilities):
+            self.utility_dictionary[location] = utility
+        self.previous_rewards = rewards
+        self.previous_utilities = utilities
+        self.previous_active = active
+
+    def backupCell(self, i, utilities, rewards, gamma):
+        """The Bellman backup of a single cell, by index."""
+        north, south, east, west = self.transitions.neighbour_indices[i]
+        best_utility = max(self.getActionValues(utilities[north], utilities[south], utilities[east], utilities[west]))
+        return rewards[i] + gamma * best_utility
+
+    def getChangedCells(self, rewards, active):
+        """The cells whose reward, or whether they are terminal,
+        is different from the last move: eaten food and capsules,
+        ghosts that moved and scared timers that ran out."""
+        return [i for i in range(len(rewards))
+                if rewards[i] != self.previous_rewards[i] or active[i] != self.previous_active[i]]
+
+    def incrementalValueIteration(self):
+        """Warm-started value iteration. The utilities from the last
+        move are the starting point, and only the cells whose reward
+        changed, and their predecessors, are queued for a backup.
+        The array engine works through them in order, the prioritized
+        engine by Bellman residual."""
+        rewards, utilities, active = self.createUtilityArrays()
+        # Terminal cells take the ghost utility, everything else starts warm
+        utilities = [previous if is_active else utility
+                     for previous, utility, is_active in zip(self.previous_utilities, utilities, active)]
+        predecessors = self.transitions.predecessors
+        seeds = []
+        seeded = [False] * len(utilities)
+        for changed in self.getChangedCells(rewards, active):
+            for i in [changed] + predecessors[changed]:
+                if active[i] and not seeded[i]:
+                    seeds.append(i)
+                    seeded[i] = True
+        if self.engine == 'prioritized':
+            self.prioritizedSweeping(seeds, rewards, utilities, active)
+        else:
+            self.propagateChanges(seeds, rewards, utilities, active)
+        # Sweep equivalents, so this compares with the other engines
+        self.sweep_count = self.backup_count / float(len(utilities))
+        self.storeUtilityArrays(rewards, utilities, active)
+
+    def propagateChanges(self, seeds, rewards, utilities, active):
+        """Backs up the queued cells in order. Any cell that changes by
+        more than the convergence threshold queues its predecessors."""
+        gamma = self.getGamma()
+        threshold = self.getConvergenceThreshold()
+        predecessors = self.transitions.predecessors
+        queue = deque(seeds)
+        queued = [False] * len(utilities)
+        for i in seeds:
+            queued[i] = True
+        while queue:
+            i = queue.popleft()
+            queued[i] = False
+            utility = self.backupCell(i, utilities, rewards, gamma)
+            self.backup_count += 1
+            if abs(utility - utilities[i]) >= threshold:
+                for j in predecessors[i]:
+                    if active[j] and not queued[j]:
+                        queue.append(j)
+                        queued[j] = True
+            utilities[i] = utility
+
+    def prioritizedValueIteration(self):
+        """Value iteration from scratch by prioritized sweeping: every
+        cell starts on the queue, keyed by its Bellman residual."""
+        rewards, utilities, active = self.createUtilityArrays()
+        seeds = [i for i in range(len(utilities)) if active[i]]
+        self.prioritizedSweeping(seeds, rewards, utilities, active)
+        self.sweep_count = self.backup_count / float(len(utilities))
+        self.storeUtilityArrays(rewards, utilities, active)
+
+    def queueResidual(self, i, queue, priorities, rewards, utilities, gamma, threshold):
+        """Puts a cell on the queue if its Bellman residual is above
+        the threshold and larger than the one it is queued with."""
+        residual = abs(self.backupCell(i, utilities, rewards, gamma) - utilities[i])
+        self.residual_count += 1
+        if residual >= threshold and residual > priorities[i]:
+            priorities[i] = residual
+            queue.push(i, -residual)
+
+    def prioritizedSweeping(self, seeds, rewards, utilities, active):
+        """Backs up the cell with the largest Bellman residual first.
+        Backing up a cell can only change the residuals of its
+        predecessors, so only those are recomputed. Outdated queue
+        entries are skipped rather than removed."""
+        gamma = self.getGamma()
+        threshold = self.getConvergenceThreshold()
+        predecessors = self.transitions.predecessors
+        queue = util.PriorityQueue()
+        priorities = [0] * len(utilities)
+        for i in seeds:
+            self.queueResidual(i, queue, priorities, rewards, utilities, gamma, threshold)
+        while not queue.isEmpty():
+            i = queue.pop()
+            if priorities[i] == 0:
+                continue
+            priorities[i] = 0
+            utilities[i] = self.backupCell(i, utilities, rewards, gamma)
+            self.backup_count += 1
+            for j in predecessors[i]:
+                if active[j]:
+                    self.queueResidual(j, queue, priorities, rewards, utilities, gamma, threshold)
+
+    def getWindow(self, radius):
+        """The indices of the cells that pacman can reach in at
+        most radius moves, found by breadth first search over the
+        transition table."""
+        start = self.transitions.index[self.pacman_location]
+        window = [start]
+        seen = set(window)
+        frontier = window
+        for distance in range(radius):
+            next_frontier = []
+            for i in frontier:
+                for j in (self.transitions.north[i], self.transitions.south[i],
+                          self.transitions.east[i], self.transitions.west[i]):
+                    if j not in seen:
+                        seen.add(j)
+                        next_frontier.append(j)
+            window.extend(next_frontier)
+            frontier = next_frontier
+        return window
+
+    def windowValueIteration(self):
+        """Value iteration over the cells within the window radius of
+        pacman only. Cells outside the window keep the utilities of a
+        coarse solution of the whole map, which is cached and
+        re-solved every COARSE_INTERVAL moves, or as soon as the
+        capsules or the scared ghosts change, since those move
+        the largest rewards on the map."""
+        coarse_key = (tuple(self.capsule_locations), tuple([ghost_state[1] for ghost_state in self.ghost_states]))
+        if self.coarse_utilities is None or self.coarse_age >= self.COARSE_INTERVAL or coarse_key != self.coarse_key:
+            self.arrayValueIteration(self.COARSE_EPSILON)
+            self.coarse_utilities = self.previous_utilities
+            self.coarse_age = 0
+            self.coarse_key = coarse_key
+        self.coarse_age += 1
+        rewards, utilities, active = self.createUtilityArrays()
+        utilities = [coarse if is_active else utility
+                     for coarse, utility, is_active in zip(self.coarse_utilities, utilities, active)]
+        window = [i for i in self.getWindow(self.radius) if active[i]]
+        gamma = self.getGamma()
+        threshold = self.getConvergenceThreshold()
+        while True:
+            delta = 0
+            for i in window:
+                utility = self.backupCell(i, utilities, rewards, gamma)
+                delta = max(delta, abs(utility - utilities[i]))
+                utilities[i] = utility
+            self.sweep_count += len(window) / float(len(utilities))
+            self.backup_count += len(window)
+            if delta < threshold:
                 break
+        self.storeUtilityArrays(rewards, utilities, active)
 
     def getBestMove(self):
         """This method returns the best move. It looks at
         reachable locations, along with their utility and
         returns the best action to perform."""
-        reachable_states = [i for i in self.getSurroundingCells(self.pacman_location, 1) if i not in self.wall_locations]
+        reachable_states = [i for i in self.getSurroundingCells(self.pacman_location, 1) if self.transitions.isFree(i)]
         surrounding_state_utility = [self.utility_dictionary[i] for i in reachable_states]
         best_move_location = reachable_states[surrounding_state_utility.index(max(surrounding_state_utility))]
         best_x, best_y = best_move_location
@@ -44,6 +44,7 @@ from game import GameStateData
 from game import Game
 from game import Directions
 from game import Actions
+from game import Configuration
 from util import nearestPoint
 from util import manhattanDistance
 import util, layout
@@ -72,14 +73,37 @@ class GameState:
     # Accessor methods: use these to access state data #
     ####################################################
 
-    # static variable keeps track of which states have had getLegalActions called
+    # static variables keep track of the states generateSuccessor has been
+    # called on and returned, as set by setExploredMode:
+    #   'off'    - nothing is tracked, the default for playing games
+    #   'count'  - only exploredCount, the number of successors generated
+    #   'sample' - exploredCount, and the first exploredSampleSize states in explored
+    #   'full'   - exploredCount, and every state in explored, as autograders expect
+    EXPLORED_MODES = ['off', 'count', 'sample', 'full']
+    exploredMode = 'off'
+    exploredSampleSize = 1000
+    exploredCount = 0
     explored = set()
+
+    def setExploredMode( mode, sampleSize=1000 ):
+        if mode not in GameState.EXPLORED_MODES:
+            raise Exception('Unknown explored mode %s, choose from %s' % (mode, ', '.join(GameState.EXPLORED_MODES)))
+        GameState.exploredMode = mode
+        GameState.exploredSampleSize = sampleSize
+        GameState.getAndResetExplored()
+    setExploredMode = staticmethod(setExploredMode)
+
     def getAndResetExplored():
         tmp = GameState.explored.copy()
         GameState.explored = set()
+        GameState.exploredCount = 0
         return tmp
     getAndResetExplored = staticmethod(getAndResetExplored)
 
+    def getExploredCount():
+        return GameState.exploredCount
+    getExploredCount = staticmethod(getExploredCount)
+
     def getLegalActions( self, agentIndex=0 ):
         """
         Returns the legal actions for the agent specified.
@@ -99,8 +123,9 @@ class GameState:
         # Check that successors exist
         if self.isWin() or self.isLose(): raise Exception('Can\'t generate a successor of a terminal state.')
 
-        # Copy current state
-        state = GameState(self)
+        # Copy current state, sharing the agent states until they change
+        state = GameState()
+        state.data = GameStateData(self.data, shareAgentStates=True)
 
         # Let agent's logic deal with its action's effects on the board
         if agentIndex == 0:  # Pacman is moving
@@ -113,7 +138,7 @@ class GameState:
         if agentIndex == 0:
             state.data.scoreChange += -TIME_PENALTY # Penalty for waiting around
         else:
-            GhostRules.decrementTimer( state.data.agentStates[agentIndex] )
+            GhostRules.decrementTimer( state.data.copyAgentState(agentIndex) )
 
         # Resolve multi-agent effects
         GhostRules.checkDeath( state, agentIndex )
@@ -121,8 +146,15 @@ class GameState:
         # Book keeping
         state.data._agentMoved = agentIndex
         state.data.score += state.data.scoreChange
-        GameState.explored.add(self)
-        GameState.explored.add(state)
+        if GameState.exploredMode != 'off':
+            GameState.exploredCount += 1
+            if GameState.exploredMode == 'full':
+                GameState.explored.add(self)
+                GameState.explored.add(state)
+            elif GameState.exploredMode == 'sample':
+                for exploredState in (self, state):
+                    if len(GameState.explored) < GameState.exploredSampleSize:
+                        GameState.explored.add(exploredState)
         return state
 
     def getLegalPacmanActions( self ):
@@ -175,7 +207,13 @@ class GameState:
         return self.data.capsules
 
     def getNumFood( self ):
-        return self.data.food.count()
+        return self.data.getNumFood()
+
+    def getFoodList( self ):
+        """
+        Returns a list of positions (x,y) of the remaining food.
+        """
+        return self.data.getFoodList()
 
     def getFood(self):
         """
@@ -228,7 +266,7 @@ class GameState:
             self.data = GameStateData()
 
     def deepCopy( self ):
-        state = GameState( self )
+        state = GameState()
         state.data = self.data.deepCopy()
         return state
 
@@ -351,7 +389,7 @@ class PacmanRules:
         if action not in legal:
             raise Exception("Illegal action " + str(action))
 
-        pacmanState = state.data.agentStates[0]
+        pacmanState = state.data.copyAgentState(0)
 
         # Update Configuration
         vector = Actions.directionToVector( action, PacmanRules.PACMAN_SPEED )
@@ -370,21 +408,20 @@ class PacmanRules:
         # Eat food
         if state.data.food[x][y]:
             state.data.scoreChange += 10
-            state.data.food = state.data.food.copy()
-            state.data.food[x][y] = False
+            state.data.eatFood( position )
             state.data._foodEaten = position
-            # TODO: cache numFood?
             numFood = state.getNumFood()
             if numFood == 0 and not state.data._lose:
                 state.data.scoreChange += 500
                 state.data._win = True
         # Eat capsule
         if( position in state.getCapsules() ):
+            state.data.capsules = state.data.capsules[:]
             state.data.capsules.remove( position )
             state.data._capsuleEaten = position
             # Reset all ghosts' scared timers
             for index in range( 1, len( state.data.agentStates ) ):
-                state.data.agentStates[index].scaredTimer = SCARED_TIME
+                state.data.copyAgentState(index).scaredTimer = SCARED_TIME
     consume = staticmethod( consume )
 
 class GhostRules:
@@ -413,7 +450,7 @@ class GhostRules:
         if action not in legal:
             raise Exception("Illegal ghost action " + str(action))
 
-        ghostState = state.data.agentStates[ghostIndex]
+        ghostState = state.data.copyAgentState(ghostIndex)
         speed = GhostRules.GHOST_SPEED
         if ghostState.scaredTimer > 0: speed /= 2.0
         vector = Actions.directionToVector( action, speed )
@@ -423,7 +460,8 @@ class GhostRules:
     def decrementTimer( ghostState):
         timer = ghostState.scaredTimer
         if timer == 1:
-            ghostState.configuration.pos = nearestPoint( ghostState.configuration.pos )
+            configuration = ghostState.configuration
+            ghostState.configuration = Configuration( nearestPoint( configuration.pos ), configuration.direction )
         ghostState.scaredTimer = max( 0, timer - 1 )
     decrementTimer = staticmethod( decrementTimer )
 
@@ -434,12 +472,12 @@ class GhostRules:
                 ghostState = state.data.agentStates[index]
                 ghostPosition = ghostState.configuration.getPosition()
                 if GhostRules.canKill( pacmanPosition, ghostPosition ):
-                    GhostRules.collide( state, ghostState, index )
+                    GhostRules.collide( state, state.data.copyAgentState(index), index )
         else:
             ghostState = state.data.agentStates[agentIndex]
             ghostPosition = ghostState.configuration.getPosition()
             if GhostRules.canKill( pacmanPosition, ghostPosition ):
-                GhostRules.collide( state, ghostState, agentIndex )
+                GhostRules.collide( state, state.data.copyAgentState(agentIndex), agentIndex )
     checkDeath = staticmethod( checkDeath )
 
     def collide( state, ghostState, agentIndex):
@@ -521,7 +559,19 @@ def readCommand( argv ):
     parser.add_option('-r', '--recordActions', action='store_true', dest='record',
                       help='Writes game histories to a file (named by the time they were played)', default=False)
     parser.add_option('--replay', dest='gameToReplay',
-                      help='A recorded game file (pickle) to replay', default=None)
+                      help='A recorded game file (pickle or recording file) to replay', default=None)
+    parser.add_option('--replayGame', dest='replayGame', type='int',
+                      help=default('Which game of a recording file to replay, counting from 0'), default=0)
+    parser.add_option('--replayFrom', dest='replayFrom', type='int',
+                      help=default('Skips the replay straight to this move, without displaying the moves before it'), default=0)
+    parser.add_option('--replayTo', dest='replayTo', type='int',
+                      help='Stops the replay at this move [Default: the end of the game]', default=None)
+    parser.add_option('--recordFile', dest='recordFile',
+                      help='Writes every game to this recording file (see recording.py)', default=None)
+    parser.add_option('--explored', dest='explored',
+                      help=default('Which generated states GameState.explored keeps: off, count, sample or full'), default='off')
+    parser.add_option('--exploredSampleSize', dest='exploredSampleSize', type='int',
+                      help=default('How many states GameState.explored keeps with --explored sample'), default=1000)
     parser.add_option('-a','--agentArgs',dest='agentArgs',
                       help='Comma separated values sent to agent. e.g. "opt1=val1,opt2,opt3=val3"')
     parser.add_option('-x', '--numTraining', dest='numTraining', type='int',
@@ -532,6 +582,22 @@ def readCommand( argv ):
                       help='Turns on exception handling and timeouts during games', default=False)
     parser.add_option('--timeout', dest='timeout', type='int',
                       help=default('Maximum length of time an agent can spend computing in a single game'), default=30)
+    parser.add_option('-w', '--workers', dest='workers', type='int',
+                      help=default('Number of processes to play games in; more than 1 plays them headless'), default=1)
+    parser.add_option('--resultsFile', dest='resultsFile',
+                      help='Writes one record per game to this file as it ends, as CSV if it ends in .csv and JSON lines otherwise', default=None)
+    parser.add_option('--timings', action='store_true', dest='timings',
+                      help='Times each phase of every ply and prints latency percentiles per agent', default=False)
+    parser.add_option('--timingsFile', dest='timingsFile',
+                      help='Writes the latencies of --timings, merged over all games, to this file as JSON', default=None)
+    parser.add_option('--profile', dest='profile',
+                      help='Profiles games with cprofile, sample or counters, writing a file per game (see profiling.py)', default=None)
+    parser.add_option('--profileGames', dest='profileGames',
+                      help='The games to profile, counting from 0, like 0,5,10-19 [Default: all]', default=None)
+    parser.add_option('--profileMoves', dest='profileMoves',
+                      help='The moves of each game to profile, like 90:110 [Default: all]', default=None)
+    parser.add_option('--profileDir', dest='profileDir',
+                      help=default('The directory --profile writes to'), default='profiles')
 
     options, otherjunk = parser.parse_args(argv)
     if len(otherjunk) != 0:
@@ -541,6 +607,13 @@ def readCommand( argv ):
     # Fix the random seed
     if options.fixRandomSeed: random.seed('cs188')
 
+    GameState.setExploredMode(options.explored, options.exploredSampleSize)
+
+    if options.profile:
+        import profiling
+        profiling.attachProfiler(options.profile, options.profileDir, options.profileGames,
+                                 options.profileMoves, GameState)
+
     # Choose a layout
     args['layout'] = layout.getLayout( options.layout )
     if args['layout'] == None: raise Exception("The layout " + options.layout + " cannot be found")
@@ -577,16 +650,44 @@ def readCommand( argv ):
         args['display'] = graphicsDisplay.PacmanGraphics(options.zoom, frameTime = options.frameTime)
     args['numGames'] = options.numGames
     args['record'] = options.record
+    args['recordFile'] = options.recordFile
     args['catchExceptions'] = options.catchExceptions
     args['timeout'] = options.timeout
+    args['workers'] = options.workers
+    args['layoutName'] = options.layout
+    args['resultsFile'] = options.resultsFile
+    args['keepGames'] = False
+    args['timings'] = options.timings
+    args['timingsFile'] = options.timingsFile
 
     # Special case: recorded games don't use the runGames method or args structure
     if options.gameToReplay != None:
-        print 'Replaying recorded game %s.' % options.gameToReplay
-        import cPickle
-        f = open(options.gameToReplay)
-        try: recorded = cPickle.load(f)
-        finally: f.close()
+        import recording
+        start = time.time()
+        if recording.isRecording(options.gameToReplay):
+            print 'Replaying game %d of recording %s.' % (options.replayGame, options.gameToReplay)
+            reader = recording.RecordingReader(options.gameToReplay)
+            try:
+                recorded = {'layout': reader.getLayout(options.replayGame),
+                            'actions': reader.getActions(options.replayGame, options.replayFrom, options.replayTo),
+                            'numGhosts': reader.getNumGhosts(options.replayGame)}
+                if options.replayFrom > 0:
+                    recorded['startState'] = reader.getState(options.replayGame, options.replayFrom)
+            finally: reader.close()
+        else:
+            print 'Replaying recorded game %s.' % options.gameToReplay
+            import cPickle
+            f = open(options.gameToReplay)
+            try: recorded = cPickle.load(f)
+            finally: f.close()
+            # Old recordings have no keyframes, so the moves before the window are played out
+            actions = recorded['actions']
+            recorded['actions'] = actions[options.replayFrom:options.replayTo]
+            if options.replayFrom > 0:
+                startState = recording.getStartState(recorded['layout'], recorded['layout'].getNumGhosts() + 1)
+                recorded['startState'] = recording.playActions(startState, actions[:options.replayFrom])
+        if options.replayFrom > 0:
+            print 'Skipped to move %d in %.1fms.' % (options.replayFrom, 1000 * (time.time() - start))
         recorded['display'] = args['display']
         replayGame(**recorded)
         sys.exit(0)
@@ -616,11 +717,17 @@ def loadAgent(pacman, nographics):
                 return getattr(module, pacman)
     raise Exception('The agent ' + pacman + ' is not specified in any *Agents.py.')
 
-def replayGame( layout, actions, display ):
+def replayGame( layout, actions, display, numGhosts=None, startState=None ):
+    """
+    Shows actions being played on layout. They are played from startState,
+    if given, rather than from the start of the game.
+    """
     import pacmanAgents, ghostAgents
     rules = ClassicGameRules()
-    agents = [pacmanAgents.GreedyAgent()] + [ghostAgents.RandomGhost(i+1) for i in range(layout.getNumGhosts())]
+    if numGhosts is None: numGhosts = layout.getNumGhosts()
+    agents = [pacmanAgents.GreedyAgent()] + [ghostAgents.RandomGhost(i+1) for i in range(numGhosts)]
     game = rules.newGame( layout, agents[0], agents[1:], display )
+    if startState is not None: game.state = startState
     state = game.state
     display.initialize(state.data)
 
@@ -634,46 +741,156 @@ def replayGame( layout, actions, display ):
 
     display.finish()
 
-def runGames( layout, pacman, ghosts, display, numGames, record, numTraining = 0, catchExceptions=False, timeout=30 ):
-    import __main__
+def runGames( layout, pacman, ghosts, display, numGames, record, numTraining = 0, catchExceptions=False, timeout=30, workers=1, layoutName=None, resultsFile=None, keepGames=True, recordFile=None, timings=False, timingsFile=None ):
+    """
+    Plays numGames games and prints a summary of the ones after training.
+    Each of those games becomes a record (see results.gameRecord) that
+    goes to resultsFile, if given, as soon as the game ends, and every game
+    goes to the recording file recordFile, if given. With timings, or a
+    timingsFile, the games after training time every ply and the summary
+    adds their latencies, merged over all games, which also go to
+    timingsFile as JSON. Returns the Game objects, or the records when
+    games are played by workers, unless keepGames is False.
+    """
+    import __main__, results, recording
     __main__.__dict__['_display'] = display
 
     rules = ClassicGameRules(timeout)
+    timings = timings or timingsFile is not None
     games = []
-
-    for i in range( numGames ):
-        beQuiet = i < numTraining
-        if beQuiet:
-                # Suppress output and graphics
-            import textDisplay
-            gameDisplay = textDisplay.NullGraphics()
-            rules.quiet = True
-        else:
-            gameDisplay = display
-            rules.quiet = False
-        game = rules.newGame( layout, pacman, ghosts, gameDisplay, beQuiet, catchExceptions)
-        game.run()
-        if not beQuiet: games.append(game)
-
-        if record:
-            import time, cPickle
-            fname = ('recorded-game-%d' % (i + 1)) +  '-'.join([str(t) for t in time.localtime()[1:6]])
-            f = file(fname, 'w')
-            components = {'layout': layout, 'actions': game.moveHistory}
-            cPickle.dump(components, f)
-            f.close()
-
-    if (numGames-numTraining) > 0:
-        scores = [game.state.getScore() for game in games]
-        wins = [game.state.isWin() for game in games]
-        winRate = wins.count(True)/ float(len(wins))
-        print 'Average Score:', sum(scores) / float(len(scores))
-        print 'Scores:       ', ', '.join([str(score) for score in scores])
-        print 'Win Rate:      %d/%d (%.2f)' % (wins.count(True), len(wins), winRate)
-        print 'Record:       ', ', '.join([ ['Loss', 'Win'][int(w)] for w in wins])
+    stats = results.RunningStats()
+    sink = None
+    if resultsFile: sink = results.ResultSink(resultsFile)
+    recorder = None
+    if recordFile: recorder = recording.RecordingWriter(recordFile)
+
+    def addResult( game, gameRecord ):
+        stats.add(gameRecord)
+        if sink: sink.write(gameRecord)
+        if keepGames: games.append(game)
+
+    try:
+        numSequential = numGames
+        if workers > 1: numSequential = numTraining
+        for i in range( numSequential ):
+            beQuiet = i < numTraining
+            if beQuiet:
+                    # Suppress output and graphics
+                import textDisplay
+                gameDisplay = textDisplay.NullGraphics()
+                rules.quiet = True
+            else:
+                gameDisplay = display
+                rules.quiet = False
+            game = rules.newGame( layout, pacman, ghosts, gameDisplay, beQuiet, catchExceptions)
+            game.index = i
+            if timings and not beQuiet: game.timings = results.GameTimings(len(game.agents))
+            game.run()
+            if not beQuiet: addResult(game, results.gameRecord(game, i, layoutName=layoutName))
+
+            if record: recordGame(layout, game.moveHistory, i)
+            if recorder: recorder.addGame(layout, game.moveHistory, len(ghosts))
+
+        if workers > 1:
+            keepActions = record or recorder is not None
+            for gameRecord in runParallelGames( layout, pacman, ghosts, numGames - numTraining, numTraining, keepActions, catchExceptions, timeout, workers, layoutName, timings ):
+                if keepActions:
+                    actions = gameRecord.pop('actions')
+                    if record: recordGame(layout, actions, gameRecord['index'])
+                    if recorder: recorder.addGame(layout, actions, len(ghosts))
+                addResult(gameRecord, gameRecord)
+    finally:
+        if sink: sink.close()
+        if recorder: recorder.close()
+
+    if stats.count > 0: printSummary(stats)
+    if stats.timings is not None:
+        printTimings(stats.timings)
+        if timingsFile:
+            import json
+            f = open(timingsFile, 'w')
+            try: json.dump(stats.timings.toDict(), f, indent=2, sort_keys=True)
+            finally: f.close()
 
     return games
 
+def printSummary( stats ):
+    print 'Average Score:', stats.getAverageScore()
+    print 'Scores:       ', ', '.join([str(score) for score in stats.scores])
+    print 'Win Rate:      %d/%d (%.2f)' % (stats.wins, stats.count, stats.getWinRate())
+    print 'Record:       ', ', '.join([ ['Loss', 'Win'][int(w)] for w in stats.results])
+
+def printTimings( timings ):
+    import results
+    print 'Latency (ms):   %-18s %8s %8s %8s %8s %8s %8s' % ('Phase', 'Count', 'Mean', 'p50', 'p95', 'p99', 'Max')
+    for agentIndex, histograms in enumerate(timings.agents):
+        for phase in results.TIMING_PHASES:
+            histogram = histograms[phase]
+            if histogram.count == 0: continue
+            print '  Agent %-7d %-18s %8d %8.3f %8.3f %8.3f %8.3f %8.3f' % (agentIndex, phase, histogram.count,
+                1000 * histogram.getMean(), 1000 * histogram.getPercentile(50), 1000 * histogram.getPercentile(95),
+                1000 * histogram.getPercentile(99), 1000 * histogram.max)
+
+def recordGame( layout, actions, i ):
+    import time, cPickle
+    fname = ('recorded-game-%d' % (i + 1)) +  '-'.join([str(t) for t in time.localtime()[1:6]])
+    f = file(fname, 'w')
+    components = {'layout': layout, 'actions': actions}
+    cPickle.dump(components, f)
+    f.close()
+
+# The game components a worker process plays with, set by initWorker.
+_workerGame = None
+
+def initWorker( layout, pacman, ghosts, catchExceptions, timeout, keepActions, layoutName, timings ):
+    global _workerGame
+    _workerGame = (layout, pacman, ghosts, catchExceptions, timeout, keepActions, layoutName, timings)
+
+def runWorkerGame( (index, seed) ):
+    """
+    Plays one headless game in a worker process and returns its record,
+    with the game's actions under 'actions' when keepActions is set.
+    Each game seeds the random module itself, so its outcome depends only
+    on its seed and not on which worker played it or in what order.
+    """
+    import textDisplay, results
+    layout, pacman, ghosts, catchExceptions, timeout, keepActions, layoutName, timings = _workerGame
+    random.seed(seed)
+    display = textDisplay.NullGraphics()
+    import __main__
+    __main__.__dict__['_display'] = display
+    rules = ClassicGameRules(timeout)
+    game = rules.newGame( layout, pacman, ghosts, display, True, catchExceptions)
+    game.index = index
+    if timings: game.timings = results.GameTimings(len(game.agents))
+    game.run()
+    gameRecord = results.gameRecord(game, index, seed, layoutName)
+    if keepActions: gameRecord['actions'] = game.moveHistory
+    return gameRecord
+
+def runParallelGames( layout, pacman, ghosts, numGames, numTraining, keepActions, catchExceptions, timeout, workers, layoutName=None, timings=False ):
+    """
+    Shards numGames headless games over a pool of worker processes and
+    yields one record per game, in game order, as the games finish.
+    Training games have already been played in this process, so every
+    worker starts from the trained agent. The per-game seeds are drawn
+    from the random module here, so -f makes a parallel run repeatable for
+    any number of workers (though not equal to a sequential run, which
+    shares one random stream).
+    """
+    import multiprocessing
+    seeds = [(numTraining + i, random.randint(0, sys.maxint)) for i in range(numGames)]
+    pool = multiprocessing.Pool(workers, initWorker, (layout, pacman, ghosts, catchExceptions, timeout, keepActions, layoutName, timings))
+    try:
+        for gameRecord in pool.imap(runWorkerGame, seeds):
+            yield gameRecord
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
 if __name__ == '__main__':
     """
     The main function called when pacman.py is run
@@ -688,6 +905,4 @@ if __name__ == '__main__':
     args = readCommand( sys.argv[1:] ) # Get game components based on input
     runGames( **args )
 
-    # import cProfile
-    # cProfile.run("runGames( **args )")
     pass
@@ -0,0 +1,330 @@
+# profiling.py
+# ------------
+# Hooks around the hot paths of a game, and profilers built on them.
+#
+# A hook is a pair of callbacks, either of which may be None, added to
+# one of HOOK_POINTS with addHook. pre is called just before the hooked
+# call and post just after it, even if it raised, both with the object
+# the call was made on followed by its arguments:
+#
+#   run                 Game.run(game)
+#   generateSuccessor   GameState.generateSuccessor(state, agentIndex, action)
+#   getAction           agent.getAction(agent, observation)
+#   display             display.update(display, stateData)
+#
+# Hooks cost nothing until the calls are hooked: hookGames hooks
+# Game.run, and the getAction and display.update calls of the games it
+# runs, and hookMethod hooks any other method, like generateSuccessor.
+#
+# The profilers only profile the games in a set of game numbers and,
+# within each game, the plies in a window of move numbers (counted as in
+# Game.moveHistory), and write one file per game profiled. pacman.py
+# attaches one with --profile:
+#
+#   python pacman.py -p GreedyAgent -n 1000 -q --profile cprofile --profileGames 417 --profileMoves 90:110
+
+import cProfile
+import json
+import os
+import signal
+import time
+
+import game
+
+HOOK_POINTS = ['run', 'generateSuccessor', 'getAction', 'display']
+
+# The (pre, post) pairs added to each hook point, called in order.
+HOOKS = dict([(point, []) for point in HOOK_POINTS])
+
+# The methods hookMethod replaced, by (class, name).
+HOOKED_METHODS = {}
+
+def addHook(point, pre=None, post=None):
+    if point not in HOOKS: raise Exception('Unknown hook point: ' + point)
+    HOOKS[point].append((pre, post))
+
+def removeHook(point, pre=None, post=None):
+    HOOKS[point].remove((pre, post))
+
+def callHooks(point, owner, function, *args):
+    "Calls function(*args) between the pre and post hooks of point."
+    hooks = HOOKS[point]
+    for pre, post in hooks:
+        if pre is not None: pre(owner, *args)
+    try:
+        return function(*args)
+    finally:
+        for pre, post in hooks:
+            if post is not None: post(owner, *args)
+
+def hookMethod(cls, name, point):
+    "Makes every call of cls.name call the hooks of point."
+    if (cls, name) in HOOKED_METHODS: return
+    method = cls.__dict__[name]
+    HOOKED_METHODS[(cls, name)] = method
+    def hookedMethod(self, *args):
+        return callHooks(point, self, method.__get__(self, cls), *args)
+    hookedMethod.__name__ = method.__name__
+    hookedMethod.__doc__ = method.__doc__
+    setattr(cls, name, hookedMethod)
+
+def unhookMethod(cls, name):
+    if (cls, name) in HOOKED_METHODS:
+        setattr(cls, name, HOOKED_METHODS.pop((cls, name)))
+
+def hookGames():
+    """
+    Hooks Game.run and, for the length of each game, the getAction method
+    of its agents and the update method of its display.
+    """
+    if (game.Game, 'run') in HOOKED_METHODS: return
+    run = game.Game.__dict__['run']
+    HOOKED_METHODS[(game.Game, 'run')] = run
+    def runWithHooks(self):
+        hooked = [(agent, 'getAction', 'getAction') for agent in self.agents if agent]
+        hooked.append((self.display, 'update', 'display'))
+        saved = [hookInstance(obj, name, point) for obj, name, point in hooked]
+        try:
+            return callHooks('run', self, run.__get__(self, game.Game))
+        finally:
+            for (obj, name, point), previous in reversed(zip(hooked, saved)):
+                unhookInstance(obj, name, previous)
+    runWithHooks.__name__ = run.__name__
+    runWithHooks.__doc__ = run.__doc__
+    game.Game.run = runWithHooks
+
+def unhookGames():
+    unhookMethod(game.Game, 'run')
+
+def hookInstance(obj, name, point):
+    "Hooks one object's method, returning what unhookInstance needs to undo it."
+    previous = obj.__dict__.get(name)
+    method = getattr(obj, name)
+    setattr(obj, name, lambda *args: callHooks(point, obj, method, *args))
+    return previous
+
+def unhookInstance(obj, name, previous):
+    if previous is None: del obj.__dict__[name]
+    else: setattr(obj, name, previous)
+
+#############################
+# Profilers                 #
+#############################
+
+class WindowProfiler:
+    """
+    Profiles the games numbered in games, or every game if it is None, and
+    the moves from start up to stop of each, where stop None is the end
+    of the game. The game number is the one runGames gave the game, or
+    the count of games started in this process if it gave none.
+
+    Subclasses say how to start and stop profiling in begin and end, and
+    must define write(path) to write what they gathered for a game.
+    """
+    extension = ''
+
+    def __init__(self, directory, games=None, start=0, stop=None):
+        self.directory = directory
+        self.games = games
+        self.start = start
+        self.stop = stop
+        self.gamesStarted = 0
+        self.game = None
+        self.active = False
+
+    def attach(self):
+        addHook('run', self.startGame, self.endGame)
+        addHook('getAction', self.startMove)
+
+    def detach(self):
+        removeHook('run', self.startGame, self.endGame)
+        removeHook('getAction', self.startMove)
+
+    def startGame(self, theGame):
+        self.gameIndex = theGame.index
+        if self.gameIndex is None: self.gameIndex = self.gamesStarted
+        self.gamesStarted += 1
+        self.game = None
+        if self.games is None or self.gameIndex in self.games:
+            self.game = theGame
+            self.reset()
+
+    def startMove(self, agent, observation):
+        if self.game is None: return
+        move = len(self.game.moveHistory)
+        inWindow = move >= self.start and (self.stop is None or move < self.stop)
+        if inWindow and not self.active:
+            self.active = True
+            self.begin()
+        elif not inWindow and self.active:
+            self.active = False
+            self.end()
+
+    def endGame(self, theGame):
+        if self.game is None: return
+        if self.active:
+            self.active = False
+            self.end()
+        if self.profiled:
+            if not os.path.isdir(self.directory): os.makedirs(self.directory)
+            self.write(os.path.join(self.directory, 'game-%d%s' % (self.gameIndex, self.extension)))
+        self.game = None
+
+    def reset(self):
+        "Gets ready to profile a new game."
+        self.profiled = False
+
+    def begin(self):
+        self.profiled = True
+
+    def end(self):
+        pass
+
+class CProfileProfiler(WindowProfiler):
+    "Runs cProfile over the window, and writes its stats for pstats to read."
+    extension = '.prof'
+
+    def reset(self):
+        WindowProfiler.reset(self)
+        self.profile = cProfile.Profile()
+
+    def begin(self):
+        WindowProfiler.begin(self)
+        self.profile.enable()
+
+    def end(self):
+        self.profile.disable()
+
+    def write(self, path):
+        self.profile.dump_stats(path)
+
+# Seconds of CPU time between the samples SamplingProfiler takes.
+SAMPLE_INTERVAL = 0.001
+
+class SamplingProfiler(WindowProfiler):
+    """
+    Samples the call stack every SAMPLE_INTERVAL seconds of CPU time over
+    the window, and writes how often each stack was seen in the folded
+    format flame graph tools read: one 'caller;callee count' line per stack.
+    Only works where signal.setitimer does, and in the main thread.
+    """
+    extension = '.folded'
+
+    def reset(self):
+        WindowProfiler.reset(self)
+        self.samples = {}
+
+    def begin(self):
+        WindowProfiler.begin(self)
+        self.previousHandler = signal.signal(signal.SIGPROF, self.sample)
+        signal.setitimer(signal.ITIMER_PROF, SAMPLE_INTERVAL, SAMPLE_INTERVAL)
+
+    def end(self):
+        signal.setitimer(signal.ITIMER_PROF, 0, 0)
+        signal.signal(signal.SIGPROF, self.previousHandler)
+
+    def sample(self, signum, frame):
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append('%s:%s' % (os.path.basename(code.co_filename), code.co_name))
+            frame = frame.f_back
+        key = ';'.join(reversed(stack))
+        self.samples[key] = self.samples.get(key, 0) + 1
+
+    def write(self, path):
+        f = open(path, 'w')
+        try:
+            for stack, count in sorted(self.samples.items()):
+                f.write('%s %d\n' % (stack, count))
+        finally:
+            f.close()
+
+class CountingProfiler(WindowProfiler):
+    """
+    Counts the calls to, and the time spent in, every hook point other
+    than run over the window, and writes them as JSON.
+    """
+    extension = '.json'
+
+    def attach(self):
+        WindowProfiler.attach(self)
+        self.started = dict([(point, []) for point in HOOK_POINTS if point != 'run'])
+        self.hooks = []
+        for point in HOOK_POINTS:
+            if point == 'run': continue
+            hook = self.makeCounter(point)
+            addHook(point, *hook)
+            self.hooks.append((point, hook))
+
+    def detach(self):
+        WindowProfiler.detach(self)
+        for point, hook in self.hooks:
+            removeHook(point, *hook)
+
+    def reset(self):
+        WindowProfiler.reset(self)
+        self.counts = dict([(point, 0) for point in HOOK_POINTS if point != 'run'])
+        self.seconds = dict([(point, 0.0) for point in self.counts])
+
+    def makeCounter(self, point):
+        """
+        The (pre, post) hook counting a point. Calls of it can nest, as
+        when an agent searches with generateSuccessor.
+        """
+        def pre(*args):
+            if self.active: self.started[point].append(time.time())
+            else: self.started[point].append(None)
+        def post(*args):
+            start = self.started[point].pop()
+            if start is None: return
+            self.counts[point] += 1
+            self.seconds[point] += time.time() - start
+        return pre, post
+
+    def write(self, path):
+        f = open(path, 'w')
+        try:
+            json.dump({'game': self.gameIndex, 'start': self.start, 'stop': self.stop,
+                       'calls': self.counts, 'seconds': self.seconds}, f, indent=2, sort_keys=True)
+        finally:
+            f.close()
+
+PROFILERS = {'cprofile': CProfileProfiler,
+             'sample': SamplingProfiler,
+             'counters': CountingProfiler}
+
+def parseGames(text):
+    "The game numbers in text like '0,5,10-19', or None for every game if text is empty."
+    if not text: return None
+    games = set()
+    for part in text.split(','):
+        if '-' in part:
+            first, last = part.split('-')
+            games.update(range(int(first), int(last) + 1))
+        else:
+            games.add(int(part))
+    return games
+
+def parseMoves(text):
+    "The (start, stop) of a move window like '90:110', '90:' or ':110'."
+    if not text: return 0, None
+    start, stop = text.split(':')
+    if stop: stop = int(stop)
+    else: stop = None
+    return int(start or 0), stop
+
+def attachProfiler(kind, directory, games=None, moves=None, gameStateClass=None):
+    """
+    Hooks games, and generateSuccessor on gameStateClass if given, and
+    attaches a profiler of the given kind, one of PROFILERS. games and
+    moves are strings for parseGames and parseMoves.
+    """
+    if kind not in PROFILERS:
+        raise Exception('Unknown profiler %s, choose from: %s' % (kind, ', '.join(sorted(PROFILERS))))
+    hookGames()
+    if gameStateClass is not None: hookMethod(gameStateClass, 'generateSuccessor', 'generateSuccessor')
+    start, stop = parseMoves(moves)
+    profiler = PROFILERS[kind](directory, parseGames(games), start, stop)
+    profiler.attach()
+    return profiler
@@ -0,0 +1,223 @@
+# recording.py
+# ------------
+# A compact file format for recorded games, many games to a file.
+#
+# A recording file holds, after an 8 byte magic header:
+#
+#   - the text of every layout used, once each, named by its md5 hash
+#   - for every game, its actions packed one byte each, as
+#     agentIndex * 5 + the index of the action in ACTIONS
+#   - for every game, a keyframe of the game state every
+#     KEYFRAME_INTERVAL actions, so that the state at any move can be
+#     rebuilt by replaying at most KEYFRAME_INTERVAL - 1 actions
+#   - an index saying where all of the above are, then its own offset
+#     packed as 8 bytes and an 8 byte magic footer
+#
+# Files are written with RecordingWriter and read with RecordingReader,
+# which memory maps the file so that only the parts asked for are read.
+# pacman.py writes one with --recordFile and plays it back with --replay,
+# jumping straight to --replayFrom.
+
+import array
+import marshal
+import mmap
+import struct
+
+import layout
+from game import Directions, Configuration, Grid
+
+MAGIC = 'PACREC1\n'
+FOOTER_MAGIC = 'PACRIDX\n'
+OFFSET_FORMAT = '<Q'
+OFFSET_SIZE = struct.calcsize(OFFSET_FORMAT)
+MARSHAL_VERSION = 2
+
+KEYFRAME_INTERVAL = 100
+
+ACTIONS = [Directions.NORTH, Directions.SOUTH, Directions.EAST, Directions.WEST, Directions.STOP]
+ACTION_CODES = dict([(action, code) for code, action in enumerate(ACTIONS)])
+MAX_AGENTS = 256 / len(ACTIONS)
+
+def isRecording(filename):
+    "Whether filename is a recording file, rather than an old pickled game."
+    f = open(filename, 'rb')
+    try: return f.read(len(MAGIC)) == MAGIC
+    finally: f.close()
+
+def encodeActions(actions):
+    "Packs a list of (agentIndex, action) pairs, one byte each."
+    codes = array.array('B')
+    for agentIndex, action in actions:
+        if agentIndex >= MAX_AGENTS:
+            raise Exception('Recordings hold at most %d agents' % MAX_AGENTS)
+        codes.append(agentIndex * len(ACTIONS) + ACTION_CODES[action])
+    return codes.tostring()
+
+def decodeActions(packed):
+    "Unpacks the actions encodeActions packed."
+    return [(code // len(ACTIONS), ACTIONS[code % len(ACTIONS)]) for code in array.array('B', packed)]
+
+def getKeyframe(state):
+    """
+    The parts of a GameState that change as the game is played, as a
+    marshal string. Everything else comes from the starting state.
+    """
+    data = state.data
+    agents = tuple([(agentState.configuration.pos,
+                     ACTION_CODES[agentState.configuration.direction],
+                     agentState.scaredTimer,
+                     agentState.numCarrying,
+                     agentState.numReturned) for agentState in data.agentStates])
+    return marshal.dumps((data.food.bits, tuple(data.capsules), data.score, data.scoreChange,
+                          data._win, data._lose, data._agentMoved, tuple(data._eaten), agents),
+                         MARSHAL_VERSION)
+
+def restoreKeyframe(startState, keyframe):
+    "The state a keyframe was taken of, given the game's starting state."
+    foodBits, capsules, score, scoreChange, win, lose, agentMoved, eaten, agents = marshal.loads(keyframe)
+    from pacman import GameState
+    state = GameState(startState)
+    data = state.data
+    data.food = Grid(data.food.width, data.food.height)
+    data.food.bits = foodBits
+    data.capsules = list(capsules)
+    data.score = score
+    data.scoreChange = scoreChange
+    data._win = win
+    data._lose = lose
+    data._agentMoved = agentMoved
+    data._eaten = list(eaten)
+    for agentState, (pos, direction, scaredTimer, numCarrying, numReturned) in zip(data.agentStates, agents):
+        agentState.configuration = Configuration(pos, ACTIONS[direction])
+        agentState.scaredTimer = scaredTimer
+        agentState.numCarrying = numCarrying
+        agentState.numReturned = numReturned
+    return state
+
+def playActions(state, actions):
+    "The state after playing actions from state, without displaying them."
+    for agentIndex, action in actions:
+        state = state.generateSuccessor(agentIndex, action)
+    return state
+
+def getStartState(theLayout, numAgents):
+    from pacman import GameState
+    state = GameState()
+    state.initialize(theLayout, numAgents - 1)
+    return state
+
+class RecordingWriter:
+    """
+    Writes games to a new recording file as they are added. The file can
+    only be read once the writer is closed, which writes the index.
+    """
+
+    def __init__(self, filename, keyframeInterval=KEYFRAME_INTERVAL):
+        self.file = open(filename, 'wb')
+        self.file.write(MAGIC)
+        self.keyframeInterval = keyframeInterval
+        self.layouts = {}
+        self.games = []
+
+    def addGame(self, theLayout, actions, numGhosts):
+        """
+        Adds a game played on theLayout with numGhosts ghosts, given its
+        list of (agentIndex, action) pairs. The game is replayed once to
+        take its keyframes.
+        """
+        layoutHash = theLayout.getTextHash()
+        if layoutHash not in self.layouts:
+            self.layouts[layoutHash] = self.writeBlock('\n'.join(theLayout.layoutText))
+        numAgents = min(numGhosts, theLayout.getNumGhosts()) + 1
+
+        actionsBlock = self.writeBlock(encodeActions(actions))
+        keyframeBlocks = []
+        state = getStartState(theLayout, numAgents)
+        for i, (agentIndex, action) in enumerate(actions):
+            state = state.generateSuccessor(agentIndex, action)
+            if (i + 1) % self.keyframeInterval == 0:
+                keyframeBlocks.append(self.writeBlock(getKeyframe(state)))
+        self.games.append((layoutHash, numAgents, actionsBlock, self.keyframeInterval,
+                           tuple(keyframeBlocks), state.getScore(), state.isWin()))
+
+    def writeBlock(self, data):
+        "Writes data and returns its (offset, length)."
+        offset = self.file.tell()
+        self.file.write(data)
+        return (offset, len(data))
+
+    def close(self):
+        indexOffset = self.file.tell()
+        self.file.write(marshal.dumps((self.layouts, self.games), MARSHAL_VERSION))
+        self.file.write(struct.pack(OFFSET_FORMAT, indexOffset) + FOOTER_MAGIC)
+        self.file.close()
+
+class RecordingReader:
+    """
+    Reads games from a recording file. Games are numbered from 0 in the
+    order they were added.
+    """
+
+    def __init__(self, filename):
+        self.file = open(filename, 'rb')
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        footerSize = OFFSET_SIZE + len(FOOTER_MAGIC)
+        if self.map[:len(MAGIC)] != MAGIC or self.map[-len(FOOTER_MAGIC):] != FOOTER_MAGIC:
+            raise Exception('%s is not a complete recording file' % filename)
+        indexOffset, = struct.unpack(OFFSET_FORMAT, self.map[-footerSize:-len(FOOTER_MAGIC)])
+        self.layoutBlocks, self.games = marshal.loads(self.map[indexOffset:-footerSize])
+        self.layouts = {}
+        self.startStates = {}
+
+    def getNumGames(self):
+        return len(self.games)
+
+    def readBlock(self, (offset, length)):
+        return self.map[offset:offset + length]
+
+    def getLayout(self, gameIndex):
+        layoutHash = self.games[gameIndex][0]
+        if layoutHash not in self.layouts:
+            self.layouts[layoutHash] = layout.Layout(self.readBlock(self.layoutBlocks[layoutHash]).split('\n'))
+        return self.layouts[layoutHash]
+
+    def getNumGhosts(self, gameIndex):
+        return self.games[gameIndex][1] - 1
+
+    def getNumActions(self, gameIndex):
+        return self.games[gameIndex][2][1]
+
+    def getResult(self, gameIndex):
+        "The final score of a game and whether pacman won it."
+        return self.games[gameIndex][5:7]
+
+    def getActions(self, gameIndex, start=0, stop=None):
+        "The (agentIndex, action) pairs of a game, from start up to stop."
+        offset, length = self.games[gameIndex][2]
+        if stop is None or stop > length: stop = length
+        start = max(0, min(start, stop))
+        return decodeActions(self.map[offset + start:offset + stop])
+
+    def getStartState(self, gameIndex):
+        key = (self.games[gameIndex][0], self.games[gameIndex][1])
+        if key not in self.startStates:
+            self.startStates[key] = getStartState(self.getLayout(gameIndex), key[1])
+        from pacman import GameState
+        return GameState(self.startStates[key])
+
+    def getState(self, gameIndex, moveIndex):
+        """
+        The state of a game after its first moveIndex actions, rebuilt
+        from the keyframe before it.
+        """
+        layoutHash, numAgents, actionsBlock, interval, keyframeBlocks, score, win = self.games[gameIndex]
+        moveIndex = max(0, min(moveIndex, actionsBlock[1]))
+        keyframe = min(moveIndex // interval, len(keyframeBlocks))
+        state = self.getStartState(gameIndex)
+        if keyframe > 0:
+            state = restoreKeyframe(state, self.readBlock(keyframeBlocks[keyframe - 1]))
+        return playActions(state, self.getActions(gameIndex, keyframe * interval, moveIndex))
+
+    def close(self):
+        self.map.close()
+        self.file.close()
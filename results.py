@@ -0,0 +1,225 @@
+# results.py
+# ----------
+# Per-game result records for long evaluation runs.
+#
+# runGames turns every finished game into a small record (see
+# gameRecord) and hands it to a ResultSink, which appends it to a
+# JSON-lines or CSV file straight away, and to RunningStats, which keeps
+# the summary up to date without holding on to the games themselves.
+#
+# With --timings, each game also times every ply it plays (see
+# GameTimings) and the timings travel in the game's record.
+
+import csv
+import json
+import math
+
+# The fields of a record, in the order they appear in a CSV file.
+RECORD_FIELDS = ['index', 'seed', 'layout', 'score', 'win', 'moves', 'agentTime']
+
+def gameRecord(game, index, seed=None, layoutName=None):
+    """
+    The record of one finished game. seed is the seed the game was played
+    from, if it had its own, and agentTime is pacman's total thinking time
+    in seconds. Timed games also have their GameTimings under timings.
+    """
+    record = {'index': index,
+              'seed': seed,
+              'layout': layoutName,
+              'score': game.state.getScore(),
+              'win': game.state.isWin(),
+              'moves': len(game.moveHistory),
+              'agentTime': game.totalAgentTimes[0]}
+    if game.timings is not None: record['timings'] = game.timings
+    return record
+
+def toJSON(value):
+    "How json writes the objects in a record, like its GameTimings."
+    return value.toDict()
+
+class ResultSink:
+    """
+    Appends records to a file as they arrive, one line per game. Files
+    ending in .csv are written as CSV with a header, anything else as
+    JSON lines. Every line is flushed so a run can be watched, and is not
+    lost, while it is still going.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.file = open(filename, 'w')
+        self.csvWriter = None
+        if filename.endswith('.csv'):
+            self.csvWriter = csv.DictWriter(self.file, RECORD_FIELDS, extrasaction='ignore')
+            self.csvWriter.writerow(dict(zip(RECORD_FIELDS, RECORD_FIELDS)))
+
+    def write(self, record):
+        if self.csvWriter is not None:
+            self.csvWriter.writerow(record)
+        else:
+            self.file.write(json.dumps(record, sort_keys=True, default=toJSON) + '\n')
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+class RunningStats:
+    """
+    Summary statistics over a stream of records, updated one record at a
+    time. The score variance uses Welford's method, while the average is
+    a plain running total so it prints exactly as the sum of a list
+    would. Scores and wins are also kept as lists for the per-game lines
+    of the summary runGames prints, unless keepScores is False.
+    """
+
+    def __init__(self, keepScores=True):
+        self.keepScores = keepScores
+        self.count = 0
+        self.wins = 0
+        self.totalScore = 0
+        self.meanScore = 0.0
+        self.squaredDeviations = 0.0
+        self.minScore = None
+        self.maxScore = None
+        self.totalMoves = 0
+        self.totalAgentTime = 0.0
+        self.timings = None
+        self.scores = []
+        self.results = []
+
+    def add(self, record):
+        score = record['score']
+        self.count += 1
+        if record['win']: self.wins += 1
+        self.totalScore += score
+        delta = score - self.meanScore
+        self.meanScore += delta / self.count
+        self.squaredDeviations += delta * (score - self.meanScore)
+        if self.minScore is None or score < self.minScore: self.minScore = score
+        if self.maxScore is None or score > self.maxScore: self.maxScore = score
+        self.totalMoves += record['moves']
+        self.totalAgentTime += record['agentTime']
+        if record.get('timings') is not None:
+            if self.timings is None: self.timings = GameTimings()
+            self.timings.merge(record['timings'])
+        if self.keepScores:
+            self.scores.append(score)
+            self.results.append(record['win'])
+
+    def getAverageScore(self):
+        return self.totalScore / float(self.count)
+
+    def getWinRate(self):
+        return self.wins / float(self.count)
+
+    def getScoreDeviation(self):
+        "The sample standard deviation of the scores."
+        if self.count < 2: return 0.0
+        return math.sqrt(self.squaredDeviations / (self.count - 1))
+
+#############################
+# Move timings              #
+#############################
+
+# The parts of a ply Game.run times: copying the state into the agent's
+# observation, the agent's getAction, generating the successor, updating
+# the display, and the whole ply.
+TIMING_PHASES = ['observation', 'getAction', 'generateSuccessor', 'display', 'ply']
+
+# Histogram buckets grow geometrically from MIN_LATENCY seconds, with
+# BUCKETS_PER_DOUBLING of them each time the latency doubles, so a
+# percentile read from a histogram is at most 9% above the true one.
+MIN_LATENCY = 1e-6
+BUCKETS_PER_DOUBLING = 8
+
+def getBucket(seconds):
+    "The histogram bucket a latency falls in. Bucket 0 is everything under MIN_LATENCY."
+    if seconds < MIN_LATENCY: return 0
+    return int(math.log(seconds / MIN_LATENCY, 2) * BUCKETS_PER_DOUBLING) + 1
+
+def getBucketTop(bucket):
+    "The latency every entry of a bucket is below."
+    return MIN_LATENCY * 2 ** (bucket / float(BUCKETS_PER_DOUBLING))
+
+class LatencyHistogram:
+    """
+    A histogram of latencies in seconds, with log spaced buckets so it
+    takes little room whatever the range, and merges exactly.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = {}
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max: self.max = seconds
+        bucket = getBucket(seconds)
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+
+    def merge(self, other):
+        self.count += other.count
+        self.total += other.total
+        if other.max > self.max: self.max = other.max
+        for bucket, count in other.buckets.items():
+            self.buckets[bucket] = self.buckets.get(bucket, 0) + count
+
+    def getMean(self):
+        if self.count == 0: return 0.0
+        return self.total / self.count
+
+    def getPercentile(self, percent):
+        "The top of the bucket the given percentile falls in, but never more than the maximum."
+        rank = percent / 100.0 * self.count
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= rank: return min(getBucketTop(bucket), self.max)
+        return self.max
+
+    def toDict(self):
+        return {'count': self.count,
+                'mean': self.getMean(),
+                'p50': self.getPercentile(50),
+                'p95': self.getPercentile(95),
+                'p99': self.getPercentile(99),
+                'max': self.max}
+
+class GameTimings:
+    """
+    A LatencyHistogram for each of TIMING_PHASES, for each agent, over the
+    plies of one game or, merged, of many.
+    """
+
+    def __init__(self, numAgents=0):
+        self.agents = []
+        if numAgents > 0: self.getHistograms(numAgents - 1)
+
+    def getHistograms(self, agentIndex):
+        "The histograms of an agent, by phase."
+        while len(self.agents) <= agentIndex:
+            self.agents.append(dict([(phase, LatencyHistogram()) for phase in TIMING_PHASES]))
+        return self.agents[agentIndex]
+
+    def addPly(self, agentIndex, start, observed, acted, moved, displayed):
+        "Adds a ply, given the time it started and the times each phase ended."
+        histograms = self.getHistograms(agentIndex)
+        histograms['observation'].add(observed - start)
+        histograms['getAction'].add(acted - observed)
+        histograms['generateSuccessor'].add(moved - acted)
+        histograms['display'].add(displayed - moved)
+        histograms['ply'].add(displayed - start)
+
+    def merge(self, other):
+        for agentIndex, histograms in enumerate(other.agents):
+            mine = self.getHistograms(agentIndex)
+            for phase in TIMING_PHASES:
+                mine[phase].merge(histograms[phase])
+
+    def toDict(self):
+        "The summary of each phase's histogram, as a list by agent."
+        return [dict([(phase, histogram.toDict()) for phase, histogram in histograms.items()])
+                for histograms in self.agents]
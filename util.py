@@ -27,6 +27,7 @@
 
 
 import sys
+import os
 import inspect
 import heapq, random
 import cStringIO
@@ -591,6 +592,30 @@ def lookup(name, namespace):
         if len(options) > 1: raise Exception, 'Name conflict for %s'
         raise Exception, '%s not found as a method or class' % name
 
+# Files kept only to save time in later runs, like the maze distances of a
+# layout, go in subdirectories of CACHE_DIRECTORY. It is inside the source
+# tree, and ignored by git.
+CACHE_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache')
+
+def writeCacheFile(path, data):
+    """
+    Writes the string data to a cache file, making its directory if needed.
+    The data goes to a temporary file that is then renamed to path, so
+    nothing ever reads half a file. A cache is only there to save time, so
+    failing to write it is not an error: this returns whether it worked.
+    """
+    temporaryPath = '%s.%d' % (path, os.getpid())
+    try:
+        directory = os.path.dirname(path)
+        if not os.path.isdir(directory): os.makedirs(directory)
+        f = open(temporaryPath, 'wb')
+        try: f.write(data)
+        finally: f.close()
+        os.rename(temporaryPath, path)
+    except (IOError, OSError):
+        return False
+    return True
+
 def pause():
     """
     Pauses the output stream awaiting user feedback.